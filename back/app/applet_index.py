@@ -0,0 +1,256 @@
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from . import models, versions
+from .config import get_env_int
+from .filters import Predicate, compile_filter
+from .templates import CompiledReaction
+
+RELOAD_SECONDS = get_env_int("APPLET_INDEX_RELOAD_SECONDS", 300)
+
+# Sentinelle : token Google pas encore lu (None = lu, mais absent).
+NOT_LOADED = object()
+
+
+class AppletEntry:
+    __slots__ = (
+        "id",
+        "user_id",
+        "action_choice",
+        "reaction_choice",
+        "action_config",
+        "reaction_config",
+        "version",
+        "last_action_marker",
+        "_compiled_reaction",
+        "_compiled_filter",
+    )
+
+    def __init__(self, applet: models.Applet):
+        self.id = applet.id
+        self.user_id = applet.user_id
+        self.action_choice = applet.action_choice
+        self.reaction_choice = applet.reaction_choice
+        self.action_config = applet.action_config or {}
+        self.reaction_config = applet.reaction_config or {}
+        self.version = applet.version or 0
+        self.last_action_marker = applet.last_action_marker
+        self._compiled_reaction = None
+        self._compiled_filter = None
+
+    def compiled_reaction(self) -> CompiledReaction:
+        # Compilé au premier déclenchement ; une modification de l'applet remplace l'entrée (et ce cache).
+        if self._compiled_reaction is None:
+            self._compiled_reaction = CompiledReaction(self.reaction_choice, self.reaction_config)
+        return self._compiled_reaction
+
+    def compiled_filter(self) -> Predicate:
+        if self._compiled_filter is None:
+            try:
+                self._compiled_filter = compile_filter(self.action_config)
+            except ValueError:
+                # Config invalide antérieure à la validation : ne déclenche jamais.
+                self._compiled_filter = lambda item: False
+        return self._compiled_filter
+
+
+class GoogleToken:
+    __slots__ = ("id", "access_token", "refresh_token", "created_at")
+
+    def __init__(self, token_id: int, access_token: str, refresh_token: str | None, created_at: datetime | None):
+        self.id = token_id
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.created_at = created_at
+
+    @property
+    def key(self) -> tuple[int, datetime | None]:
+        return self.id, self.created_at
+
+
+class UserEntry:
+    __slots__ = ("user_id", "email", "applets", "by_trigger", "google_token", "applets_version")
+
+    def __init__(self, user_id: int, email: str, applets_version: tuple | None = None):
+        self.user_id = user_id
+        self.email = email
+        self.applets: tuple[AppletEntry, ...] = ()
+        self.by_trigger: dict[str, tuple[AppletEntry, ...]] = {}
+        self.google_token = NOT_LOADED
+        # Version "applets" de l'utilisateur (table resource_versions) lue au chargement de l'entrée.
+        self.applets_version = applets_version
+
+    def set_applets(self, applets: list[AppletEntry]):
+        # Les tuples sont remplacés et jamais modifiés : un lecteur garde une vue cohérente sans verrou.
+        applets = sorted(applets, key=lambda entry: entry.id)
+        by_trigger: dict[str, list[AppletEntry]] = {}
+        for entry in applets:
+            by_trigger.setdefault(entry.action_choice, []).append(entry)
+        self.applets = tuple(applets)
+        self.by_trigger = {key: tuple(entries) for key, entries in by_trigger.items()}
+
+
+class AppletIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users: dict[int, UserEntry] = {}
+        self._loaded_at: float | None = None
+
+    def load(self, db: Session):
+        # Verrou tenu pendant la requête : une écriture concurrente (upsert) ne peut pas être écrasée.
+        with self._lock:
+            self._load(db)
+
+    def _load(self, db: Session):
+        # Versions lues avant les applets : une écriture concurrente laisse une version plus ancienne,
+        # l'entrée sera donc rechargée à la prochaine vérification (jamais l'inverse).
+        applet_versions = {
+            row.user_id: (row.version, row.changed_at)
+            for row in db.query(
+                models.ResourceVersion.user_id, models.ResourceVersion.version, models.ResourceVersion.changed_at
+            ).filter(models.ResourceVersion.scope == versions.APPLETS)
+        }
+        rows = (
+            db.query(models.Applet, models.User.email)
+            .join(models.User, models.User.id == models.Applet.user_id)
+            .filter(models.Applet.is_active.is_(True))
+            .all()
+        )
+        grouped: dict[int, list[AppletEntry]] = {}
+        users: dict[int, UserEntry] = {}
+        for applet, email in rows:
+            if applet.user_id not in users:
+                users[applet.user_id] = UserEntry(
+                    applet.user_id, email or "", applet_versions.get(applet.user_id, (0, None))
+                )
+            grouped.setdefault(applet.user_id, []).append(AppletEntry(applet))
+        for user_id, entries in grouped.items():
+            users[user_id].set_applets(entries)
+        self._users = users
+        self._loaded_at = time.monotonic()
+
+    def reload_if_stale(self, db: Session, max_age: int = RELOAD_SECONDS):
+        # Rechargement complet périodique : rattrape les écritures faites par d'autres process.
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > max_age:
+            self.load(db)
+
+    def user_ids(self) -> list[int]:
+        with self._lock:
+            return [user_id for user_id, entry in self._users.items() if entry.applets]
+
+    def get_user(self, db: Session, user_id: int) -> UserEntry | None:
+        with self._lock:
+            entry = self._users.get(user_id)
+        if entry is not None:
+            return entry
+        return self._load_user(db, user_id)
+
+    def get_current_user(self, db: Session, user_id: int) -> UserEntry | None:
+        # Une lecture par clé primaire (resource_versions) : une applet créée, modifiée, mise en pause
+        # ou supprimée via un autre worker est prise en compte dès l'exécution suivante.
+        applets_version = versions.current(db, user_id, versions.APPLETS)
+        with self._lock:
+            entry = self._users.get(user_id)
+        if entry is not None and entry.applets_version == applets_version:
+            return entry
+        return self._load_user(db, user_id, applets_version, replace=entry is not None)
+
+    def _load_user(
+        self, db: Session, user_id: int, applets_version: tuple | None = None, replace: bool = False
+    ) -> UserEntry | None:
+        if applets_version is None:
+            applets_version = versions.current(db, user_id, versions.APPLETS)
+        email = db.query(models.User.email).filter(models.User.id == user_id).scalar()
+        if email is None:
+            return None
+        applets = (
+            db.query(models.Applet)
+            .filter(models.Applet.user_id == user_id, models.Applet.is_active.is_(True))
+            .all()
+        )
+        entry = UserEntry(user_id, email, applets_version)
+        entry.set_applets([AppletEntry(applet) for applet in applets])
+        with self._lock:
+            if not replace:
+                return self._users.setdefault(user_id, entry)
+            previous = self._users.get(user_id)
+            if previous is not None:
+                entry.google_token = previous.google_token
+            self._users[user_id] = entry
+            return entry
+
+    def upsert(self, applet: models.Applet, email: str):
+        with self._lock:
+            entry = self._users.get(applet.user_id)
+            if entry is None:
+                if not applet.is_active:
+                    return
+                entry = self._users[applet.user_id] = UserEntry(applet.user_id, email)
+            others = [current for current in entry.applets if current.id != applet.id]
+            if applet.is_active:
+                others.append(AppletEntry(applet))
+            entry.set_applets(others)
+
+    def refresh_applet(self, db: Session, user_id: int, applet_id: int):
+        applet = db.query(models.Applet).filter(models.Applet.id == applet_id).populate_existing().first()
+        if applet is None:
+            self.remove(user_id, applet_id)
+            return
+        with self._lock:
+            entry = self._users.get(applet.user_id)
+            email = entry.email if entry else ""
+        self.upsert(applet, email)
+
+    def remove(self, user_id: int, applet_id: int):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return
+            entry.set_applets([current for current in entry.applets if current.id != applet_id])
+
+    def get_google_token(self, db: Session, user_id: int) -> GoogleToken | None:
+        entry = self.get_user(db, user_id)
+        if entry is not None and entry.google_token is not NOT_LOADED:
+            return entry.google_token
+        token = (
+            db.query(models.ServiceToken)
+            .filter(models.ServiceToken.user_id == user_id, models.ServiceToken.provider == "google")
+            .order_by(models.ServiceToken.created_at.desc())
+            .first()
+        )
+        cached = None
+        if token:
+            cached = GoogleToken(token.id, token.access_token, token.refresh_token, token.created_at)
+        if entry is not None:
+            entry.google_token = cached
+        return cached
+
+    def current_google_token_key(self, db: Session, user_id: int) -> tuple[int, datetime] | None:
+        # Lecture en base, hors cache : une reconnexion traitée par un autre worker remplace la ligne
+        # (SQLite peut réutiliser l'id, d'où la clé (id, created_at)), ce qui périme aussi le token gardé ici.
+        row = (
+            db.query(models.ServiceToken.id, models.ServiceToken.created_at)
+            .filter(models.ServiceToken.user_id == user_id, models.ServiceToken.provider == "google")
+            .order_by(models.ServiceToken.created_at.desc())
+            .first()
+        )
+        key = tuple(row) if row else None
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry.google_token is not NOT_LOADED:
+                cached = entry.google_token.key if entry.google_token else None
+                if cached != key:
+                    entry.google_token = NOT_LOADED
+        return key
+
+    def invalidate_google_token(self, user_id: int):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                entry.google_token = NOT_LOADED
+
+
+index = AppletIndex()
@@ -0,0 +1,90 @@
+import threading
+import time
+
+from .config import get_env_int
+
+FAILURE_THRESHOLD = get_env_int("BREAKER_FAILURE_THRESHOLD", 3)
+BASE_COOLDOWN_SECONDS = get_env_int("BREAKER_BASE_COOLDOWN_SECONDS", 60)
+MAX_COOLDOWN_SECONDS = get_env_int("BREAKER_MAX_COOLDOWN_SECONDS", 3600)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class BreakerState:
+    __slots__ = ("state", "failures", "trips", "open_until", "token_key")
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.token_key: tuple | None = None
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        threshold: int = FAILURE_THRESHOLD,
+        base_cooldown: int = BASE_COOLDOWN_SECONDS,
+        max_cooldown: int = MAX_COOLDOWN_SECONDS,
+    ):
+        self.threshold = threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._states: dict[tuple[int, str], BreakerState] = {}
+
+    def allow(self, user_id: int, provider: str) -> bool:
+        with self._lock:
+            current = self._states.get((user_id, provider))
+            if current is None or current.state == CLOSED:
+                return True
+            if current.state == OPEN and time.monotonic() < current.open_until:
+                return False
+            # Cooldown écoulé : une seule tentative d'essai avant de rouvrir ou refermer.
+            current.state = HALF_OPEN
+            return True
+
+    def record_success(self, user_id: int, provider: str) -> bool:
+        with self._lock:
+            current = self._states.pop((user_id, provider), None)
+        return current is not None and current.state != CLOSED
+
+    def record_failure(self, user_id: int, provider: str, token_key: tuple | None = None) -> int | None:
+        # Renvoie la durée de suspension quand le circuit passe de fermé à ouvert, None sinon.
+        with self._lock:
+            current = self._states.setdefault((user_id, provider), BreakerState())
+            current.failures += 1
+            current.token_key = token_key
+            if current.state == CLOSED and current.failures < self.threshold:
+                return None
+            opened = current.state == CLOSED
+            current.trips += 1
+            cooldown = min(self.base_cooldown * 2 ** (current.trips - 1), self.max_cooldown)
+            current.state = OPEN
+            current.open_until = time.monotonic() + cooldown
+            return cooldown if opened else None
+
+    def reset(self, user_id: int, provider: str):
+        with self._lock:
+            self._states.pop((user_id, provider), None)
+
+    def reset_if_token_changed(self, user_id: int, provider: str, token_key: tuple | None) -> bool:
+        # L'état est local au process : c'est le token en base (remplacé à chaque reconnexion)
+        # qui réarme le disjoncteur sur tous les workers, pas seulement celui qui a reçu le callback.
+        with self._lock:
+            current = self._states.get((user_id, provider))
+            if current is None or current.token_key == token_key:
+                return False
+            del self._states[(user_id, provider)]
+            return True
+
+    def is_open(self, user_id: int, provider: str) -> bool:
+        with self._lock:
+            current = self._states.get((user_id, provider))
+            return current is not None and current.state != CLOSED
+
+
+breaker = CircuitBreaker()
@@ -0,0 +1,171 @@
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import get_env, get_env_int
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MINIMUM_SIZE = get_env_int("COMPRESSION_MIN_SIZE", 500)
+GZIP_LEVEL = get_env_int("COMPRESSION_LEVEL", 6)
+BROTLI_QUALITY = get_env_int("COMPRESSION_BROTLI_QUALITY", 4)
+EXCLUDED_PATHS = tuple(
+    path.strip() for path in (get_env("COMPRESSION_EXCLUDED_PATHS") or "/health,/favicon.ico").split(",") if path.strip()
+)
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+def accepted_encodings(header: str) -> set[str]:
+    accepted = set()
+    for part in header.lower().split(","):
+        name, _, params = part.partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            pass
+        if name.strip():
+            accepted.add(name.strip())
+    return accepted
+
+
+class StreamCompressor:
+    # Chaque chunk est flushé (Z_SYNC_FLUSH / brotli flush) : un évènement SSE ou une ligne NDJSON
+    # part immédiatement au lieu d'attendre que le tampon du compresseur se remplisse.
+    def __init__(self, encoding: str, level: int, quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, flush: bool = True) -> bytes:
+        if self._brotli is not None:
+            data = self._brotli.process(data)
+            return data + self._brotli.flush() if flush else data
+        data = self._zlib.compress(data)
+        return data + self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else data
+
+    def finish(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = MINIMUM_SIZE,
+        level: int = GZIP_LEVEL,
+        brotli_quality: int = BROTLI_QUALITY,
+        excluded_paths: tuple[str, ...] = EXCLUDED_PATHS,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.excluded_paths = excluded_paths
+
+    def select_encoding(self, scope: Scope) -> str | None:
+        if scope["type"] != "http" or scope["method"] == "HEAD" or scope["path"] in self.excluded_paths:
+            return None
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        encoding = self.select_encoding(scope)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self.start: Message | None = None
+        self.compressor: StreamCompressor | None = None
+        self.passthrough = False
+
+    def compressible(self, message: Message) -> bool:
+        if message["status"] < 200 or message["status"] in (204, 206, 304):
+            return False
+        headers = Headers(raw=message["headers"])
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def start_headers(self, streaming: bool) -> MutableHeaders:
+        headers = MutableHeaders(raw=self.start["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        # La représentation compressée n'est plus identique octet pour octet : ETag faible.
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+        if streaming:
+            del headers["Content-Length"]
+        return headers
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            self.passthrough = not self.compressible(message)
+            if self.passthrough:
+                await self._send(message)
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        middleware = self.middleware
+        if self.compressor is None and not more_body:
+            # Réponse complète en un seul message : compressée seulement si elle est assez grosse
+            # et si le résultat est effectivement plus petit.
+            compressed = b""
+            if len(body) >= middleware.minimum_size:
+                compressor = StreamCompressor(self.encoding, middleware.level, middleware.brotli_quality)
+                compressed = compressor.compress(body, flush=False) + compressor.finish()
+            if not compressed or len(compressed) >= len(body):
+                await self._send(self.start)
+                await self._send(message)
+                return
+            headers = self.start_headers(streaming=False)
+            headers["Content-Length"] = str(len(compressed))
+            await self._send(self.start)
+            await self._send({"type": "http.response.body", "body": compressed})
+            return
+
+        if self.compressor is None:
+            self.compressor = StreamCompressor(self.encoding, middleware.level, middleware.brotli_quality)
+            self.start_headers(streaming=True)
+            await self._send(self.start)
+        data = self.compressor.compress(body) if body else b""
+        if not more_body:
+            data += self.compressor.finish()
+        await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
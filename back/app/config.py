@@ -0,0 +1,20 @@
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Seul endroit qui charge back/.env : tous les modules lisent leur configuration via get_env.
+ENV_PATH = Path(__file__).resolve().parents[1] / ".env"
+load_dotenv(dotenv_path=ENV_PATH, override=True)
+
+
+def get_env(name: str, default: str | None = None) -> str | None:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip()
+
+
+def get_env_int(name: str, default: int) -> int:
+    value = get_env(name)
+    return int(value) if value else default
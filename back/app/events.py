@@ -0,0 +1,104 @@
+import asyncio
+import json
+import threading
+
+from .config import get_env_int
+
+SUBSCRIBER_BUFFER_SIZE = get_env_int("EVENTS_BUFFER_SIZE", 100)
+MAX_SUBSCRIBERS_PER_USER = get_env_int("EVENTS_MAX_SUBSCRIBERS_PER_USER", 10)
+HEARTBEAT_SECONDS = 15
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+def format_event(event_type: str, data: dict) -> str:
+    return f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class Subscriber:
+    __slots__ = ("user_id", "loop", "queue", "dropped")
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def push(self, frame: str):
+        # Exécuté dans la boucle du subscriber : un client lent perd les plus
+        # anciens évènements (et reçoit un "resync") au lieu de bloquer l'émetteur.
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(frame)
+
+
+class EventBroker:
+    def __init__(self, buffer_size: int = SUBSCRIBER_BUFFER_SIZE, max_per_user: int = MAX_SUBSCRIBERS_PER_USER):
+        self.buffer_size = buffer_size
+        self.max_per_user = max_per_user
+        self._lock = threading.Lock()
+        self._subscribers: dict[int, set[Subscriber]] = {}
+
+    def subscribe(self, user_id: int) -> Subscriber:
+        subscriber = Subscriber(user_id, asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            current = self._subscribers.setdefault(user_id, set())
+            if len(current) >= self.max_per_user:
+                raise TooManySubscribers()
+            current.add(subscriber)
+        return subscriber
+
+    def has_capacity(self, user_id: int) -> bool:
+        with self._lock:
+            return len(self._subscribers.get(user_id, ())) < self.max_per_user
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            current = self._subscribers.get(subscriber.user_id)
+            if not current:
+                return
+            current.discard(subscriber)
+            if not current:
+                del self._subscribers[subscriber.user_id]
+
+    def publish(self, user_id: int, event_type: str, data: dict):
+        # Appelable depuis n'importe quel thread (endpoints sync, scheduler).
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        if not subscribers:
+            return
+        frame = format_event(event_type, data)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.push, frame)
+            except RuntimeError:
+                self.unsubscribe(subscriber)
+
+    async def stream(self, user_id: int):
+        # L'abonnement est pris au premier chunk : un client parti avant le début du flux
+        # (générateur jamais itéré) ne laisse aucun subscriber orphelin.
+        try:
+            subscriber = self.subscribe(user_id)
+        except TooManySubscribers:
+            yield format_event("error", {"detail": "too_many_streams"})
+            return
+        try:
+            yield f"retry: 5000\n\n{format_event('ready', {'user_id': user_id})}"
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if subscriber.dropped:
+                    yield format_event("resync", {"dropped": subscriber.dropped})
+                    subscriber.dropped = 0
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+
+broker = EventBroker()
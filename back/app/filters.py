@@ -0,0 +1,101 @@
+import re
+from email.utils import parseaddr
+from typing import Callable
+
+Predicate = Callable[[dict], bool]
+
+OPERATORS = ("contains", "not_contains", "equals", "regex", "domain")
+
+# Raccourcis acceptés dans action_config, convertis en filtres {"field", "op", "value"}.
+SHORTCUTS = {
+    "from_email": ("from", "contains"),
+    "from_domain": ("from", "domain"),
+    "subject_contains": ("subject", "contains"),
+    "subject_regex": ("subject", "regex"),
+    "label": ("labels", "equals"),
+    "summary_contains": ("summary", "contains"),
+    "location_contains": ("location", "contains"),
+}
+
+
+class FilterError(ValueError):
+    pass
+
+
+def match_all(item: dict) -> bool:
+    return True
+
+
+def _domain(value: str) -> str:
+    _, addr = parseaddr(value)
+    return (addr or value).rpartition("@")[2].lower()
+
+
+def _compile_condition(field: str, op: str, value) -> Predicate:
+    if not isinstance(field, str) or not field:
+        raise FilterError("Filtre invalide : champ manquant")
+    if op not in OPERATORS:
+        raise FilterError(f"Filtre invalide : opérateur '{op}' inconnu")
+    if not isinstance(value, str) or not value:
+        raise FilterError(f"Filtre invalide : valeur manquante pour '{field}'")
+
+    if op == "regex":
+        try:
+            pattern = re.compile(value, re.IGNORECASE)
+        except re.error as exc:
+            raise FilterError(f"Filtre invalide : regex '{value}' ({exc})") from exc
+        test = lambda candidate: pattern.search(candidate) is not None
+    elif op == "domain":
+        expected = value.lower().lstrip("@")
+        test = lambda candidate: _domain(candidate) == expected or _domain(candidate).endswith(f".{expected}")
+    elif op == "equals":
+        expected = value.lower()
+        test = lambda candidate: candidate.lower() == expected
+    else:
+        expected = value.lower()
+        test = lambda candidate: expected in candidate.lower()
+
+    if op == "not_contains":
+        # Négation sur l'ensemble des valeurs : aucune ne doit contenir le texte.
+        return lambda item: not any(test(candidate) for candidate in _values(item.get(field)))
+    return lambda item: any(test(candidate) for candidate in _values(item.get(field)))
+
+
+def _values(value) -> list[str]:
+    if value is None:
+        return [""]
+    if isinstance(value, (list, tuple)):
+        return [str(candidate) for candidate in value]
+    return [str(value)]
+
+
+def conditions_from_config(config: dict) -> list[tuple[str, str, str]]:
+    conditions = []
+    for key, (field, op) in SHORTCUTS.items():
+        if config.get(key):
+            conditions.append((field, op, config[key]))
+    raw_filters = config.get("filters") or []
+    if not isinstance(raw_filters, list):
+        raise FilterError("Filtre invalide : 'filters' doit être une liste")
+    for raw in raw_filters:
+        if not isinstance(raw, dict):
+            raise FilterError("Filtre invalide : chaque filtre doit être un objet")
+        conditions.append((raw.get("field"), raw.get("op", "contains"), raw.get("value")))
+    return conditions
+
+
+def references_field(config: dict, field: str) -> bool:
+    try:
+        return any(condition[0] == field for condition in conditions_from_config(config or {}))
+    except FilterError:
+        return False
+
+
+def compile_filter(config: dict) -> Predicate:
+    # Compilé une fois par applet ; l'évaluation se fait localement sur les métadonnées déjà récupérées.
+    predicates = [_compile_condition(*condition) for condition in conditions_from_config(config or {})]
+    if not predicates:
+        return match_all
+    if len(predicates) == 1:
+        return predicates[0]
+    return lambda item: all(predicate(item) for predicate in predicates)
@@ -0,0 +1,50 @@
+from typing import Callable
+
+BATCH_MODIFY_LIMIT = 1000
+
+
+class GmailModifyBuffer:
+    # Write-behind des modifications de labels d'un utilisateur : regroupées par opération
+    # puis envoyées en users.messages.batchModify (1000 ids max par appel) à la fin de l'exécution.
+    def __init__(self, gmail_factory: Callable[[], object]):
+        self._gmail_factory = gmail_factory
+        self._pending: dict[tuple[tuple[str, ...], tuple[str, ...]], dict[str, None]] = {}
+        self.calls = 0
+        self.modified: list[str] = []
+        self.failed: dict[str, str] = {}
+
+    def add(self, message_id: str, add_labels: tuple[str, ...] = (), remove_labels: tuple[str, ...] = ()):
+        key = (tuple(sorted(add_labels)), tuple(sorted(remove_labels)))
+        self._pending.setdefault(key, {})[message_id] = None
+
+    def mark_read(self, message_id: str):
+        self.add(message_id, remove_labels=("UNREAD",))
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self._pending.values())
+
+    def flush(self) -> dict[str, str]:
+        # Renvoie les échecs de ce flush, par message.
+        pending, self._pending = self._pending, {}
+        failed: dict[str, str] = {}
+        if not pending:
+            return failed
+        gmail = self._gmail_factory()
+        for (add_labels, remove_labels), ids in pending.items():
+            message_ids = list(ids)
+            for start in range(0, len(message_ids), BATCH_MODIFY_LIMIT):
+                chunk = message_ids[start : start + BATCH_MODIFY_LIMIT]
+                body = {"ids": chunk}
+                if add_labels:
+                    body["addLabelIds"] = list(add_labels)
+                if remove_labels:
+                    body["removeLabelIds"] = list(remove_labels)
+                self.calls += 1
+                try:
+                    gmail.users().messages().batchModify(userId="me", body=body).execute()
+                except Exception as exc:
+                    failed.update(dict.fromkeys(chunk, str(exc) or exc.__class__.__name__))
+                    continue
+                self.modified.extend(chunk)
+        self.failed.update(failed)
+        return failed
@@ -0,0 +1,114 @@
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from .config import get_env_int
+from .database import SessionLocal
+from .profiling import profiler
+
+RUN_WORKERS = get_env_int("APPLET_RUN_WORKERS", 4)
+MAX_KEPT_JOBS = get_env_int("APPLET_RUN_JOBS_KEPT", 1000)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class RunJob:
+    __slots__ = (
+        "id",
+        "user_id",
+        "source",
+        "status",
+        "results",
+        "error",
+        "created_at",
+        "started_at",
+        "finished_at",
+        "future",
+    )
+
+    def __init__(self, user_id: int, source: str):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.source = source
+        self.status = PENDING
+        self.results: list[dict] | None = None
+        self.error: str | None = None
+        self.created_at = datetime.utcnow()
+        self.started_at: datetime | None = None
+        self.finished_at: datetime | None = None
+        self.future: Future | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "source": self.source,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "results": self.results,
+            "error": self.error,
+        }
+
+
+class JobRunner:
+    def __init__(self, workers: int = RUN_WORKERS, keep: int = MAX_KEPT_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="applet-run")
+        self._keep = keep
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[str, RunJob] = OrderedDict()
+        self._inflight: dict[int, RunJob] = {}
+
+    def submit(self, user_id: int, runner: Callable[[Session, int], list[dict]], source: str = "manual") -> RunJob:
+        # Une seule exécution en cours par utilisateur : un second appel récupère le job existant.
+        with self._lock:
+            job = self._inflight.get(user_id)
+            if job:
+                return job
+            job = RunJob(user_id, source)
+            self._jobs[job.id] = job
+            self._inflight[user_id] = job
+            self._trim()
+            job.future = self._executor.submit(self._execute, job, runner)
+        return job
+
+    def get(self, job_id: str) -> RunJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _execute(self, job: RunJob, runner: Callable[[Session, int], list[dict]]):
+        job.status = RUNNING
+        job.started_at = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            with profiler.thread_scope(f"job:{job.source}"):
+                job.results = runner(db, job.user_id)
+            job.status = DONE
+        except Exception as exc:
+            job.error = str(exc) or exc.__class__.__name__
+            job.status = FAILED
+        finally:
+            db.close()
+            job.finished_at = datetime.utcnow()
+            with self._lock:
+                if self._inflight.get(job.user_id) is job:
+                    del self._inflight[job.user_id]
+        return job
+
+    def _trim(self):
+        excess = len(self._jobs) - self._keep
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at][:excess]:
+            del self._jobs[job_id]
+
+
+runner = JobRunner()
@@ -0,0 +1,56 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import get_env_int
+
+LEASE_SECONDS = get_env_int("APPLET_LEASE_SECONDS", 300)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def acquire_user_lease(db: Session, user_id: int, ttl: int = LEASE_SECONDS) -> str | None:
+    # Bail exclusif par utilisateur, partagé entre process/machines via la base.
+    # Renvoie le jeton du bail, ou None si un autre worker exécute déjà cet utilisateur.
+    now = datetime.utcnow()
+    token = f"{WORKER_ID}:{uuid.uuid4().hex[:12]}"
+    result = db.execute(
+        update(models.ExecutionLease)
+        .where(models.ExecutionLease.user_id == user_id, models.ExecutionLease.expires_at < now)
+        .values(owner=token, expires_at=now + timedelta(seconds=ttl))
+    )
+    if result.rowcount == 1:
+        db.commit()
+        return token
+    db.rollback()
+    try:
+        db.add(models.ExecutionLease(user_id=user_id, owner=token, expires_at=now + timedelta(seconds=ttl)))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    return token
+
+
+def renew_user_lease(db: Session, user_id: int, token: str, ttl: int = LEASE_SECONDS) -> bool:
+    result = db.execute(
+        update(models.ExecutionLease)
+        .where(models.ExecutionLease.user_id == user_id, models.ExecutionLease.owner == token)
+        .values(expires_at=datetime.utcnow() + timedelta(seconds=ttl))
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def release_user_lease(db: Session, user_id: int, token: str):
+    db.execute(
+        delete(models.ExecutionLease).where(
+            models.ExecutionLease.user_id == user_id, models.ExecutionLease.owner == token
+        )
+    )
+    db.commit()
@@ -1,26 +1,27 @@
-import os
-from pathlib import Path
 import asyncio
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 from starlette.responses import Response
 from starlette.middleware.sessions import SessionMiddleware
-from dotenv import load_dotenv
 from sqlalchemy import text
 
+from .compression import CompressionMiddleware
+from .config import get_env
 from .database import Base, engine, SessionLocal
-from . import models
-from .routers import auth, applets
+from . import jobs, models, static_assets
+from .profiling import SlowRequestMiddleware, profiler
+from .applet_index import index as applet_index
+from .routers import admin, auth, applets, front
 
-ENV_PATH = Path(__file__).resolve().parents[1] / ".env"
-load_dotenv(dotenv_path=ENV_PATH, override=True)
+# Sert front/ sous /app (URLs hachées, variantes gzip/brotli et WebP construites au démarrage).
+SERVE_FRONT = get_env("SERVE_FRONT", "0") == "1"
 
 app = FastAPI(title="AREA IFTT Basic API")
 
 app.add_middleware(
     SessionMiddleware,
-    secret_key=os.getenv("SESSION_SECRET", os.getenv("SECRET_KEY", "dev-session-secret")),
+    secret_key=get_env("SESSION_SECRET", get_env("SECRET_KEY", "dev-session-secret")),
     same_site="lax",
     https_only=False,
     session_cookie="area_session",
@@ -35,6 +36,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(CompressionMiddleware)
+
+app.add_middleware(SlowRequestMiddleware)
+
 
 @app.get("/", include_in_schema=False)
 def root(request: Request):
@@ -109,6 +114,9 @@ def on_startup():
                     conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)"))
                     conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)"))
                     break
+        token_cols = conn.execute(text("PRAGMA table_info(service_tokens)")).fetchall()
+        if token_cols and "suspended_at" not in {col[1] for col in token_cols}:
+            conn.execute(text("ALTER TABLE service_tokens ADD COLUMN suspended_at DATETIME"))
         applet_cols = conn.execute(text("PRAGMA table_info(applets)")).fetchall()
         if applet_cols:
             existing = {col[1] for col in applet_cols}
@@ -120,6 +128,17 @@ def on_startup():
                 conn.execute(text("ALTER TABLE applets ADD COLUMN is_active INTEGER DEFAULT 1"))
             if "last_action_marker" not in existing:
                 conn.execute(text("ALTER TABLE applets ADD COLUMN last_action_marker VARCHAR(255)"))
+            if "version" not in existing:
+                conn.execute(text("ALTER TABLE applets ADD COLUMN version INTEGER DEFAULT 0"))
+            # Les configs étaient stockées en TEXT : même format que la colonne JSON, il suffit
+            # de normaliser les valeurs vides/invalides que json.loads ne pourrait pas relire.
+            for column in ("action_config", "reaction_config"):
+                conn.execute(
+                    text(
+                        f"UPDATE applets SET {column} = '{{}}' "
+                        f"WHERE {column} IS NULL OR trim({column}) = '' OR json_valid({column}) = 0"
+                    )
+                )
         conn.execute(
             text(
                 """
@@ -137,23 +156,48 @@ def on_startup():
         conn.execute(text("CREATE INDEX IF NOT EXISTS ix_applet_logs_user_id ON applet_logs (user_id)"))
         conn.execute(text("CREATE INDEX IF NOT EXISTS ix_applet_logs_applet_id ON applet_logs (applet_id)"))
 
+    db = SessionLocal()
+    try:
+        applet_index.load(db)
+    finally:
+        db.close()
+
+    if SERVE_FRONT:
+        static_assets.load_bundle()
+
     asyncio.create_task(run_applets_scheduler())
 
 
+def reload_applet_index():
+    db = SessionLocal()
+    try:
+        with profiler.thread_scope("scheduler:reload_index"):
+            applet_index.reload_if_stale(db)
+    finally:
+        db.close()
+
+
 async def run_applets_scheduler():
     while True:
         await asyncio.sleep(30)
-        db = SessionLocal()
+        capture = profiler.begin_tick()
         try:
-            user_ids = [row[0] for row in db.query(models.Applet.user_id).distinct().all()]
-            for user_id in user_ids:
-                try:
-                    applets.run_applets_for_user(db, user_id)
-                except Exception:
-                    continue
+            await asyncio.to_thread(reload_applet_index)
+            user_ids = applet_index.user_ids()
+            scheduled = [
+                jobs.runner.submit(user_id, applets.run_applets_for_user, source="scheduler")
+                for user_id in user_ids
+            ]
+            await asyncio.gather(
+                *(asyncio.wrap_future(job.future) for job in scheduled),
+                return_exceptions=True,
+            )
         finally:
-            db.close()
+            profiler.end_capture(capture)
 
 
 app.include_router(auth.router)
 app.include_router(applets.router)
+app.include_router(admin.router)
+if SERVE_FRONT:
+    app.include_router(front.router)
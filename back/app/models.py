@@ -1,9 +1,13 @@
 from datetime import datetime
-from sqlalchemy import String, Integer, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import JSON, String, Integer, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .database import Base
 
+# JSON natif : JSON1 sous SQLite, JSONB sous Postgres.
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+
 
 class User(Base):
     __tablename__ = "users"
@@ -33,6 +37,8 @@ class ServiceToken(Base):
     access_token: Mapped[str] = mapped_column(Text)
     refresh_token: Mapped[str | None] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # Posé quand le disjoncteur (local à un worker) suspend les applets : lu par /auth/google/status.
+    suspended_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
 
     user: Mapped[User] = relationship(back_populates="service_tokens")
 
@@ -47,10 +53,11 @@ class Applet(Base):
     action_choice: Mapped[str] = mapped_column(String(100))
     reaction_service: Mapped[str] = mapped_column(String(50))
     reaction_choice: Mapped[str] = mapped_column(String(100))
-    action_config: Mapped[str] = mapped_column(Text, default="{}")
-    reaction_config: Mapped[str] = mapped_column(Text, default="{}")
+    action_config: Mapped[dict] = mapped_column(JSONType, default=dict)
+    reaction_config: Mapped[dict] = mapped_column(JSONType, default=dict)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     last_action_marker: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     user: Mapped[User] = relationship(back_populates="applets")
@@ -65,3 +72,20 @@ class AppletLog(Base):
     status: Mapped[str] = mapped_column(String(20))
     message: Mapped[str] = mapped_column(String(255))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class ExecutionLease(Base):
+    __tablename__ = "execution_leases"
+
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), primary_key=True)
+    owner: Mapped[str] = mapped_column(String(255))
+    expires_at: Mapped[datetime] = mapped_column(DateTime)
+
+
+class ResourceVersion(Base):
+    __tablename__ = "resource_versions"
+
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), primary_key=True)
+    scope: Mapped[str] = mapped_column(String(20), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+    changed_at: Mapped[datetime] = mapped_column(DateTime)
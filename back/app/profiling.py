@@ -0,0 +1,330 @@
+import itertools
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import get_env_int
+
+SAMPLE_INTERVAL_MS = get_env_int("PROFILE_INTERVAL_MS", 10)
+CAPTURES_KEPT = get_env_int("PROFILE_CAPTURES_KEPT", 20)
+SLOW_RUN_MS = get_env_int("PROFILE_SLOW_RUN_MS", 5000)
+SLOW_RUNS_KEPT = get_env_int("PROFILE_SLOW_RUNS_KEPT", 50)
+RECENT_SAMPLES = 50_000
+MAX_STACK_DEPTH = 96
+
+# Feuilles d'un thread inactif (file d'attente de pool, boucle asyncio en attente) : non échantillonnées.
+IDLE_FUNCTIONS = frozenset({"wait", "select", "_worker", "_wait_for_tstate_lock"})
+
+_frame_labels: dict[object, str] = {}
+
+
+def fold_stack(frame, root: str) -> str | None:
+    # Format "folded" (flamegraph.pl, speedscope, inferno) : racine;...;feuille
+    if frame.f_code.co_name in IDLE_FUNCTIONS:
+        return None
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        label = _frame_labels.get(code)
+        if label is None:
+            label = _frame_labels[code] = f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}"
+        names.append(label)
+        frame = frame.f_back
+    names.append(root)
+    names.reverse()
+    return ";".join(names)
+
+
+class Capture:
+    __slots__ = ("id", "label", "started_at", "started", "duration", "samples", "stacks")
+
+    def __init__(self, capture_id: int, label: str):
+        self.id = capture_id
+        self.label = label
+        self.started_at = datetime.utcnow()
+        self.started = time.monotonic()
+        self.duration: float | None = None
+        self.samples = 0
+        self.stacks: Counter[str] = Counter()
+
+    def add(self, stacks: list[str]):
+        self.samples += len(stacks)
+        self.stacks.update(stacks)
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "label": self.label,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000) if self.duration is not None else None,
+            "samples": self.samples,
+        }
+
+
+class Profiler:
+    # Profiler par échantillonnage (sys._current_frames) : le thread d'échantillonnage ne tourne que
+    # lorsqu'une capture est armée, le coût est nul le reste du temps.
+    def __init__(self, interval_ms: int = SAMPLE_INTERVAL_MS, keep: int = CAPTURES_KEPT):
+        self.interval = interval_ms / 1000
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._thread: threading.Thread | None = None
+        self._scopes: dict[int, str] = {}
+        self._ticks_remaining = 0
+        self._active: list[Capture] = []
+        self._recent: deque[tuple[float, str]] = deque(maxlen=RECENT_SAMPLES)
+        self.slow_request_ms: int | None = None
+        self.slow_requests_until = 0.0
+        self.captures: deque[Capture] = deque(maxlen=keep)
+        self.slow_runs: deque[dict] = deque(maxlen=SLOW_RUNS_KEPT)
+
+    @contextmanager
+    def thread_scope(self, label: str):
+        # Les threads du scheduler et des jobs sont rattachés aux captures de ticks ;
+        # les autres threads actifs sont attribués aux requêtes lentes.
+        ident = threading.get_ident()
+        with self._lock:
+            self._scopes[ident] = label
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._scopes.pop(ident, None)
+
+    def scope_of(self, ident: int) -> str | None:
+        with self._lock:
+            return self._scopes.get(ident)
+
+    def arm_ticks(self, count: int):
+        with self._lock:
+            self._ticks_remaining = count
+
+    def arm_slow_requests(self, threshold_ms: int, duration_seconds: int):
+        with self._lock:
+            self.slow_request_ms = threshold_ms
+            self.slow_requests_until = time.monotonic() + duration_seconds
+            self._recent.clear()
+        self._ensure_sampler()
+
+    def disarm(self):
+        with self._lock:
+            self._ticks_remaining = 0
+            self.slow_request_ms = None
+            self._recent.clear()
+
+    def _watching_requests(self) -> bool:
+        if self.slow_request_ms is None:
+            return False
+        if time.monotonic() >= self.slow_requests_until:
+            self.slow_request_ms = None
+            self._recent.clear()
+            return False
+        return True
+
+    def slow_requests_armed(self) -> bool:
+        with self._lock:
+            return self._watching_requests()
+
+    def begin_tick(self) -> Capture | None:
+        with self._lock:
+            if self._ticks_remaining <= 0:
+                return None
+            self._ticks_remaining -= 1
+            capture = Capture(next(self._ids), "scheduler tick")
+            self._active.append(capture)
+        self._ensure_sampler()
+        return capture
+
+    def end_capture(self, capture: Capture | None):
+        if capture is None:
+            return
+        with self._lock:
+            self._active.remove(capture)
+            capture.duration = time.monotonic() - capture.started
+            self.captures.append(capture)
+
+    def record_request(self, label: str, started: float, finished: float):
+        with self._lock:
+            if self.slow_request_ms is None or (finished - started) * 1000 < self.slow_request_ms:
+                return
+            stacks = [stack for at, stack in self._recent if started <= at <= finished]
+            capture = Capture(next(self._ids), f"{label} ({round((finished - started) * 1000)} ms)")
+            capture.started = started
+            capture.duration = finished - started
+            capture.add(stacks)
+            self.captures.append(capture)
+
+    def get_capture(self, capture_id: int) -> Capture | None:
+        with self._lock:
+            return next((capture for capture in self.captures if capture.id == capture_id), None)
+
+    def status(self) -> dict:
+        with self._lock:
+            watching = self._watching_requests()
+            return {
+                "ticks_remaining": self._ticks_remaining,
+                "active_captures": len(self._active),
+                "slow_request_ms": self.slow_request_ms if watching else None,
+                "slow_requests_seconds_left": round(self.slow_requests_until - time.monotonic()) if watching else 0,
+                "interval_ms": round(self.interval * 1000),
+                "captures": [capture.to_dict() for capture in self.captures],
+                "slow_runs": len(self.slow_runs),
+            }
+
+    def _ensure_sampler(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active)
+                watching = self._watching_requests()
+                if not active and not watching:
+                    self._thread = None
+                    return
+                scopes = dict(self._scopes)
+            now = time.monotonic()
+            scoped: list[str] = []
+            unscoped: list[str] = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                label = scopes.get(ident)
+                if label is None and not watching:
+                    continue
+                stack = fold_stack(frame, label or "request")
+                if stack is None:
+                    continue
+                (scoped if label else unscoped).append(stack)
+            with self._lock:
+                for capture in active:
+                    capture.add(scoped)
+                if watching:
+                    self._recent.extend((now, stack) for stack in unscoped)
+
+
+profiler = Profiler()
+
+
+class SlowRequestMiddleware:
+    # Ne fait rien tant que le mode "requêtes lentes" n'est pas armé ; ensuite, chaque requête plus
+    # lente que le seuil devient une capture (échantillons des threads actifs pendant la requête).
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not profiler.slow_requests_armed():
+            await self.app(scope, receive, send)
+            return
+        streaming = False
+
+        async def send_wrapper(message: Message):
+            nonlocal streaming
+            if message["type"] == "http.response.start":
+                streaming = Headers(raw=message["headers"]).get("content-type", "").startswith("text/event-stream")
+            await send(message)
+
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Un flux SSE reste ouvert par construction : ce n'est pas une requête lente.
+            if not streaming:
+                profiler.record_request(f"{scope['method']} {scope['path']}", started, time.monotonic())
+
+
+class RunTrace:
+    __slots__ = ("user_id", "started_at", "started", "phases", "applets", "_lock")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.phases: dict[str, list] = {}
+        self.applets: dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, elapsed: float, applet_id: int | None):
+        # Les réactions d'un même utilisateur s'exécutent en parallèle : spans ajoutés sous verrou.
+        with self._lock:
+            current = self.phases.setdefault(phase, [0, 0.0])
+            current[0] += 1
+            current[1] += elapsed
+            if applet_id is not None:
+                self.applets[applet_id] = self.applets.get(applet_id, 0.0) + elapsed
+
+    def to_dict(self, duration: float) -> dict:
+        slowest = sorted(self.applets.items(), key=lambda item: item[1], reverse=True)[:10]
+        return {
+            "user_id": self.user_id,
+            "started_at": self.started_at,
+            "duration_ms": round(duration * 1000),
+            "phases": {
+                phase: {"count": count, "ms": round(elapsed * 1000, 1)} for phase, (count, elapsed) in self.phases.items()
+            },
+            "slowest_applets": [{"id": applet_id, "ms": round(elapsed * 1000, 1)} for applet_id, elapsed in slowest],
+        }
+
+
+_local = threading.local()
+
+
+@contextmanager
+def run_trace(user_id: int):
+    # Trace de l'exécution des applets d'un utilisateur : gardée dans l'anneau slow_runs
+    # si elle dépasse PROFILE_SLOW_RUN_MS.
+    trace = RunTrace(user_id)
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = None
+        duration = time.perf_counter() - trace.started
+        if duration * 1000 >= SLOW_RUN_MS:
+            profiler.slow_runs.append(trace.to_dict(duration))
+
+
+@contextmanager
+def span(phase: str, applet_id: int | None = None):
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(phase, time.perf_counter() - started, applet_id)
+
+
+def bind(fn):
+    # Propage la trace et le scope du thread appelant aux threads de pool qui exécutent fn.
+    trace = getattr(_local, "trace", None)
+    label = profiler.scope_of(threading.get_ident())
+
+    def run(*args, **kwargs):
+        _local.trace = trace
+        try:
+            if label is None:
+                return fn(*args, **kwargs)
+            with profiler.thread_scope(label):
+                return fn(*args, **kwargs)
+        finally:
+            _local.trace = None
+
+    return run
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from .. import models, schemas
+from ..profiling import profiler
+from .auth import get_admin_user
+
+router = APIRouter(prefix="/admin/profiling", tags=["admin"])
+
+
+@router.get("")
+def profiling_status(admin: models.User = Depends(get_admin_user)):
+    return profiler.status()
+
+
+@router.post("/ticks", status_code=status.HTTP_202_ACCEPTED)
+def profile_next_ticks(payload: schemas.ProfileTicksIn, admin: models.User = Depends(get_admin_user)):
+    profiler.arm_ticks(payload.count)
+    return profiler.status()
+
+
+@router.post("/slow-requests", status_code=status.HTTP_202_ACCEPTED)
+def profile_slow_requests(payload: schemas.ProfileSlowRequestsIn, admin: models.User = Depends(get_admin_user)):
+    profiler.arm_slow_requests(payload.threshold_ms, payload.duration_seconds)
+    return profiler.status()
+
+
+@router.delete("", status_code=status.HTTP_204_NO_CONTENT)
+def disarm_profiling(admin: models.User = Depends(get_admin_user)):
+    profiler.disarm()
+
+
+@router.get("/captures/{capture_id}", response_class=PlainTextResponse)
+def get_capture(capture_id: int, admin: models.User = Depends(get_admin_user)):
+    # Piles au format "folded" : flamegraph.pl capture.txt > capture.svg, ou import direct dans speedscope.
+    capture = profiler.get_capture(capture_id)
+    if not capture:
+        raise HTTPException(status_code=404, detail="Capture introuvable")
+    return PlainTextResponse(
+        capture.folded(),
+        headers={"Content-Disposition": f'attachment; filename="capture-{capture.id}.folded"'},
+    )
+
+
+@router.get("/slow-runs")
+def list_slow_runs(admin: models.User = Depends(get_admin_user)):
+    return list(profiler.slow_runs)
@@ -1,23 +1,51 @@
+from __future__ import annotations
+
 import base64
-import json
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 from email.utils import parseaddr
 from email.message import EmailMessage
+from typing import TYPE_CHECKING
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from google.auth.exceptions import RefreshError
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
 from ..database import SessionLocal
-from .. import models, schemas
-from .auth import get_current_user
-from .auth import get_env
+from .. import events, filters, jobs, leases, models, profiling, schemas, templates, versions
+from ..applet_index import AppletEntry, index as applet_index
+from ..breaker import breaker
+from ..config import get_env, get_env_int
+from ..gmail_batch import GmailModifyBuffer
+from ..security import STREAM_SCOPE, STREAM_TOKEN_EXPIRE_SECONDS, create_stream_token
+from .auth import get_current_user, get_user_from_token
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
 
 router = APIRouter(prefix="/applets", tags=["applets"])
 
+# Les listings sélectionnent directement les colonnes exposées et sont sérialisés par orjson,
+# sans matérialiser d'objets ORM ni re-valider via Pydantic (les schémas restent pour l'OpenAPI).
+APPLET_OUT_FIELDS = tuple(schemas.AppletOut.model_fields)
+APPLET_OUT_COLUMNS = tuple(getattr(models.Applet, field) for field in APPLET_OUT_FIELDS)
+LOG_OUT_COLUMNS = tuple(getattr(models.AppletLog, field) for field in schemas.AppletLogOut.model_fields)
+
+
+def serialize_applet(applet: models.Applet) -> dict:
+    return {field: getattr(applet, field) for field in APPLET_OUT_FIELDS}
+
+
+def build(service_name: str, version: str, credentials: Credentials):
+    # Le client Google (discovery, httplib2, google-auth) n'est chargé qu'à la première exécution d'applet.
+    from googleapiclient.discovery import build as build_service
+
+    return build_service(service_name, version, credentials=credentials)
+
 
 def get_db():
     db = SessionLocal()
@@ -33,6 +61,13 @@ def create_applet(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
+    unknown = templates.unknown_variables(payload.reaction_config)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Variable(s) inconnue(s) : {', '.join(unknown)}")
+    try:
+        filters.compile_filter(payload.action_config)
+    except filters.FilterError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
     applet = models.Applet(
         user_id=current_user.id,
         name=payload.name,
@@ -40,30 +75,34 @@ def create_applet(
         action_choice=payload.action_choice,
         reaction_service=payload.reaction_service,
         reaction_choice=payload.reaction_choice,
-        action_config=json.dumps(payload.action_config),
-        reaction_config=json.dumps(payload.reaction_config),
+        action_config=payload.action_config,
+        reaction_config=payload.reaction_config,
     )
     db.add(applet)
+    versions.bump(db, current_user.id, versions.APPLETS)
     db.commit()
     db.refresh(applet)
-    return applet
+    applet_index.upsert(applet, current_user.email)
+    events.broker.publish(current_user.id, "applet", {"id": applet.id, "state": "created", "is_active": applet.is_active})
+    return ORJSONResponse(serialize_applet(applet), status_code=status.HTTP_201_CREATED)
 
 
 @router.get("", response_model=list[schemas.AppletOut])
 def list_applets(
+    request: Request,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    applets = (
-        db.query(models.Applet)
+    cached, headers = versions.not_modified(db, request, current_user.id, versions.APPLETS)
+    if cached:
+        return cached
+    rows = (
+        db.query(*APPLET_OUT_COLUMNS)
         .filter(models.Applet.user_id == current_user.id)
         .order_by(models.Applet.created_at.desc())
         .all()
     )
-    for applet in applets:
-        applet.action_config = json.loads(applet.action_config or "{}")
-        applet.reaction_config = json.loads(applet.reaction_config or "{}")
-    return applets
+    return ORJSONResponse([row._asdict() for row in rows], headers=headers)
 
 
 @router.patch("/{applet_id}/active", response_model=schemas.AppletOut)
@@ -81,11 +120,14 @@ def set_applet_active(
     if not applet:
         raise HTTPException(status_code=404, detail="Applet introuvable")
     applet.is_active = bool(payload.is_active)
+    # Nouvelle version : une exécution qui a lu l'applet active ne peut plus poser son marqueur.
+    applet.version = models.Applet.version + 1
+    versions.bump(db, current_user.id, versions.APPLETS)
     db.commit()
     db.refresh(applet)
-    applet.action_config = json.loads(applet.action_config or "{}")
-    applet.reaction_config = json.loads(applet.reaction_config or "{}")
-    return applet
+    applet_index.upsert(applet, current_user.email)
+    events.broker.publish(current_user.id, "applet", {"id": applet.id, "state": "updated", "is_active": applet.is_active})
+    return ORJSONResponse(serialize_applet(applet))
 
 
 @router.delete("/{applet_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -102,31 +144,72 @@ def delete_applet(
     if not applet:
         raise HTTPException(status_code=404, detail="Applet introuvable")
     db.delete(applet)
+    versions.bump(db, current_user.id, versions.APPLETS)
     db.commit()
+    applet_index.remove(current_user.id, applet_id)
+    events.broker.publish(current_user.id, "applet", {"id": applet_id, "state": "deleted"})
     return None
 
 
 @router.get("/logs", response_model=list[schemas.AppletLogOut])
 def list_logs(
+    request: Request,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    return (
-        db.query(models.AppletLog)
+    cached, headers = versions.not_modified(db, request, current_user.id, versions.LOGS)
+    if cached:
+        return cached
+    rows = (
+        db.query(*LOG_OUT_COLUMNS)
         .filter(models.AppletLog.user_id == current_user.id)
         .order_by(models.AppletLog.created_at.desc())
         .limit(100)
         .all()
     )
+    return ORJSONResponse([row._asdict() for row in rows], headers=headers)
 
 
-def get_google_credentials(db: Session, user_id: int) -> Credentials:
-    token = (
-        db.query(models.ServiceToken)
-        .filter(models.ServiceToken.user_id == user_id, models.ServiceToken.provider == "google")
-        .order_by(models.ServiceToken.created_at.desc())
-        .first()
+def resolve_stream_user_id(token: str, scope: str | None) -> int:
+    db = SessionLocal()
+    try:
+        return get_user_from_token(db, token, scope).id
+    finally:
+        db.close()
+
+
+@router.post("/events/token", response_model=schemas.StreamToken)
+def create_events_token(current_user: models.User = Depends(get_current_user)):
+    # EventSource ne permet pas d'envoyer un header Authorization : le front échange son JWT
+    # contre un token court, limité au flux, qui seul peut passer en query string.
+    return {"token": create_stream_token(str(current_user.id)), "expires_in": STREAM_TOKEN_EXPIRE_SECONDS}
+
+
+@router.get("/events")
+async def stream_events(request: Request, token: str | None = None):
+    scope = STREAM_SCOPE
+    if not token:
+        scheme, _, value = (request.headers.get("authorization") or "").partition(" ")
+        token, scope = (value, None) if scheme.lower() == "bearer" else (None, None)
+    if not token:
+        raise HTTPException(status_code=401, detail="Token manquant")
+    # Aucune session DB n'est gardée pendant le flux : seule l'authentification touche la base.
+    user_id = await run_in_threadpool(resolve_stream_user_id, token, scope)
+    if not events.broker.has_capacity(user_id):
+        raise HTTPException(status_code=429, detail="Trop de flux ouverts pour cet utilisateur")
+    return StreamingResponse(
+        events.broker.stream(user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
+
+
+def get_google_credentials(db: Session, user_id: int) -> Credentials:
+    from google.auth.exceptions import RefreshError
+    from google.auth.transport.requests import Request as GoogleRequest
+    from google.oauth2.credentials import Credentials
+
+    token = applet_index.get_google_token(db, user_id)
     if not token:
         raise HTTPException(status_code=400, detail="Service Google non connecté")
     if not token.refresh_token:
@@ -161,26 +244,97 @@ def get_google_credentials(db: Session, user_id: int) -> Credentials:
 
     if should_refresh:
         try:
-            credentials.refresh(Request())
+            credentials.refresh(GoogleRequest())
         except RefreshError as exc:
             raise HTTPException(status_code=400, detail="Token Google expiré. Reconnecte Google.") from exc
-        token.access_token = credentials.token or token.access_token
-        token.created_at = datetime.utcnow()
+        refreshed_at = datetime.utcnow()
+        db.execute(
+            update(models.ServiceToken)
+            .where(models.ServiceToken.id == token.id)
+            .values(access_token=credentials.token or token.access_token, created_at=refreshed_at),
+            execution_options={"synchronize_session": False},
+        )
+        versions.bump(db, user_id, versions.GOOGLE)
         db.commit()
+        token.access_token = credentials.token or token.access_token
+        token.created_at = refreshed_at
 
     return credentials
 
 
+def add_applet_log(db: Session, user_id: int, applet_id: int, status: str, message: str) -> models.AppletLog:
+    log = models.AppletLog(
+        user_id=user_id,
+        applet_id=applet_id,
+        status=status,
+        message=message,
+        created_at=datetime.utcnow(),
+    )
+    db.add(log)
+    return log
+
+
+def commit_applet_logs(db: Session, user_id: int, logs: list[models.AppletLog]):
+    # Les évènements SSE ne partent qu'une fois la transaction validée.
+    with profiling.span("log"):
+        if logs:
+            versions.bump(db, user_id, versions.LOGS)
+        db.flush()
+        payloads = [
+            {
+                "id": log.id,
+                "applet_id": log.applet_id,
+                "status": log.status,
+                "message": log.message,
+                "created_at": log.created_at.isoformat(),
+            }
+            for log in logs
+        ]
+        db.commit()
+    for payload in payloads:
+        events.broker.publish(user_id, "log", payload)
+
+
 def log_applet(db: Session, user_id: int, applet_id: int, status: str, message: str):
-    db.add(
-        models.AppletLog(
-            user_id=user_id,
-            applet_id=applet_id,
-            status=status,
-            message=message,
+    commit_applet_logs(db, user_id, [add_applet_log(db, user_id, applet_id, status, message)])
+
+
+def claim_action_marker(db: Session, applet_id: int, expected_version: int, marker: str) -> bool:
+    # Compare-and-set : seul le worker qui voit encore la version lue pose le marqueur,
+    # avant de déclencher la réaction ; les autres abandonnent sans réagir.
+    # Pas de commit ici : l'appelant valide toutes les réservations d'une exécution en une transaction.
+    with profiling.span("marker_commit", applet_id):
+        result = db.execute(
+            update(models.Applet)
+            .where(
+                models.Applet.id == applet_id,
+                models.Applet.version == expected_version,
+                models.Applet.is_active.is_(True),
+            )
+            .values(last_action_marker=marker, version=models.Applet.version + 1),
+            execution_options={"synchronize_session": False},
         )
-    )
-    db.commit()
+    return result.rowcount == 1
+
+
+def release_action_marker(db: Session, applet_id: int, claimed_version: int, previous_marker: str | None):
+    # La réaction a échoué : on rend l'action à nouveau éligible, sauf si quelqu'un est passé entre-temps.
+    with profiling.span("marker_commit", applet_id):
+        db.execute(
+            update(models.Applet)
+            .where(models.Applet.id == applet_id, models.Applet.version == claimed_version)
+            .values(last_action_marker=previous_marker, version=models.Applet.version + 1),
+            execution_options={"synchronize_session": False},
+        )
+
+
+def is_auth_failure(exc: Exception) -> bool:
+    # Token absent, incomplet ou révoqué (get_google_credentials lève 400) : inutile de réessayer à chaque tick.
+    if isinstance(exc, HTTPException):
+        return exc.status_code == 400
+    from google.auth.exceptions import RefreshError
+
+    return isinstance(exc, RefreshError)
 
 
 def normalize_error_message(message: str) -> str:
@@ -230,152 +384,519 @@ def extract_email_address(value: str) -> str:
     return addr or value
 
 
-def run_gmail_action(credentials: Credentials, applet: models.Applet, db: Session, config: dict) -> dict | None:
-    gmail = build("gmail", "v1", credentials=credentials)
-    query = "is:unread in:inbox"
-    from_email = (config or {}).get("from_email") or ""
-    if from_email:
-        query = f"{query} from:{from_email}"
-    result = gmail.users().messages().list(userId="me", maxResults=1, q=query).execute()
-    messages = result.get("messages", [])
-    if not messages:
-        return None
-    message_id = messages[0]["id"]
-    if applet.last_action_marker == message_id:
-        return None
-    message = (
-        gmail.users()
-        .messages()
-        .get(userId="me", id=message_id, format="metadata", metadataHeaders=["From", "Subject"])
-        .execute()
-    )
-    headers = message.get("payload", {}).get("headers", [])
-    return {
-        "message_id": message_id,
-        "from": get_header_value(headers, "From"),
-        "subject": get_header_value(headers, "Subject"),
-    }
+def build_template_context(action_payload: dict, user_email: str) -> dict[str, str]:
+    context = {key: str(value) for key, value in action_payload.items() if value is not None}
+    context["from_email"] = extract_email_address(action_payload.get("from", ""))
+    context["user_email"] = user_email
+    return context
 
 
-def run_calendar_action(credentials: Credentials, applet: models.Applet, db: Session, config: dict) -> dict | None:
-    calendar = build("calendar", "v3", credentials=credentials)
-    calendar_id = (config or {}).get("calendar") or "primary"
-    events = (
-        calendar.events()
-        .list(calendarId=calendar_id, maxResults=1, singleEvents=True, orderBy="updated")
-        .execute()
-        .get("items", [])
-    )
-    if not events:
+GMAIL_SCAN_SIZE = min(get_env_int("GMAIL_SCAN_SIZE", 25), 100)
+CALENDAR_SCAN_SIZE = get_env_int("CALENDAR_SCAN_SIZE", 25)
+CALENDAR_UPDATED_WINDOW_HOURS = get_env_int("CALENDAR_UPDATED_WINDOW_HOURS", 24)
+USER_CONCURRENCY = get_env_int("APPLET_USER_CONCURRENCY", 8)
+
+
+class ActionSnapshot:
+    # Métadonnées Gmail/Agenda d'un utilisateur récupérées une fois par exécution et partagées
+    # par toutes ses applets : chaque filtre est évalué localement au lieu d'une recherche Google par applet.
+    def __init__(self, credentials: Credentials, applets: tuple[AppletEntry, ...]):
+        self.credentials = credentials
+        self.scan_all_messages = any(
+            applet.action_choice == "gmail_new_mail" and applet.compiled_filter() is not filters.match_all
+            for applet in applets
+        )
+        # Gmail renvoie des ids de labels ("Label_123…") : les noms ne sont résolus que si un filtre porte dessus.
+        self.resolve_labels = any(
+            applet.action_choice == "gmail_new_mail" and filters.references_field(applet.action_config, "labels")
+            for applet in applets
+        )
+        self._gmail = None
+        self._calendar = None
+        self._local = threading.local()
+        self._results: dict[tuple, object] = {}
+        self.gmail_modifications = GmailModifyBuffer(lambda: self.gmail)
+
+    @property
+    def gmail(self):
+        if self._gmail is None:
+            self._gmail = build("gmail", "v1", credentials=self.credentials)
+        return self._gmail
+
+    @property
+    def calendar(self):
+        if self._calendar is None:
+            self._calendar = build("calendar", "v3", credentials=self.credentials)
+        return self._calendar
+
+    def http(self):
+        # httplib2.Http n'est pas thread-safe : les réactions concurrentes partagent credentials et
+        # services (discovery déjà chargé) mais chacune passe le transport authentifié de son thread.
+        http = getattr(self._local, "http", None)
+        if http is None:
+            import google_auth_httplib2
+            import httplib2
+
+            http = self._local.http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=httplib2.Http())
+        return http
+
+    def _memo(self, key: tuple, fetch):
+        # Une erreur Google est mémorisée aussi : chaque applet la reçoit sans nouvel appel.
+        if key not in self._results:
+            try:
+                self._results[key] = fetch()
+            except Exception as exc:
+                self._results[key] = exc
+        result = self._results[key]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def gmail_message_ids(self) -> list[str]:
+        def fetch():
+            result = (
+                self.gmail.users()
+                .messages()
+                .list(userId="me", maxResults=GMAIL_SCAN_SIZE, q="is:unread in:inbox")
+                .execute()
+            )
+            return [message["id"] for message in result.get("messages", [])]
+
+        return self._memo(("gmail_ids",), fetch)
+
+    def gmail_messages(self) -> list[dict]:
+        def fetch():
+            message_ids = self.gmail_message_ids()
+            if not self.scan_all_messages:
+                message_ids = message_ids[:1]
+            found = fetch_gmail_metadata(self.gmail, message_ids)
+            messages = [found[message_id] for message_id in message_ids if message_id in found]
+            if self.resolve_labels:
+                names = self.gmail_label_names()
+                for message in messages:
+                    # Un filtre "label" accepte indifféremment le nom affiché ou l'id du label.
+                    labels = message["labels"]
+                    message["labels"] = labels + [names[label] for label in labels if label in names]
+            return messages
+
+        return self._memo(("gmail_messages",), fetch)
+
+    def gmail_label_names(self) -> dict[str, str]:
+        def fetch():
+            result = self.gmail.users().labels().list(userId="me").execute()
+            return {label["id"]: label["name"] for label in result.get("labels", [])}
+
+        return self._memo(("gmail_labels",), fetch)
+
+    def calendar_events(self, calendar_id: str) -> list[dict]:
+        def fetch():
+            # orderBy="updated" est croissant, sans ordre inverse : on borne la fenêtre avec updatedMin,
+            # on pagine jusqu'à la fin et on garde les derniers évènements, parcourus du plus récent au plus ancien.
+            updated_min = datetime.utcnow() - timedelta(hours=CALENDAR_UPDATED_WINDOW_HOURS)
+            events_api = self.calendar.events()
+            request = events_api.list(
+                calendarId=calendar_id,
+                maxResults=250,
+                singleEvents=True,
+                orderBy="updated",
+                updatedMin=updated_min.isoformat(timespec="seconds") + "Z",
+            )
+            items: deque[dict] = deque(maxlen=CALENDAR_SCAN_SIZE)
+            while request is not None:
+                response = request.execute()
+                items.extend(response.get("items", []))
+                request = events_api.list_next(request, response)
+            return [
+                {
+                    "event_id": item["id"],
+                    "calendar_id": calendar_id,
+                    "summary": item.get("summary", ""),
+                    "description": item.get("description", ""),
+                    "location": item.get("location", ""),
+                    "status": item.get("status", ""),
+                    "organizer": (item.get("organizer") or {}).get("email", ""),
+                }
+                for item in reversed(items)
+            ]
+
+        return self._memo(("calendar", calendar_id), fetch)
+
+
+class GmailMetadataError(Exception):
+    pass
+
+
+def fetch_gmail_metadata(gmail, message_ids: list[str]) -> dict[str, dict]:
+    found: dict[str, dict] = {}
+    failed: dict[str, Exception] = {}
+
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            # Un message supprimé entre le listing et le batch (404) est simplement ignoré ; toute autre
+            # erreur (429, 5xx) fait échouer le snapshot pour ne pas déclencher sur une liste incomplète.
+            if getattr(getattr(exception, "resp", None), "status", None) != 404:
+                failed[request_id] = exception
+            return
+        headers = response.get("payload", {}).get("headers", [])
+        found[request_id] = {
+            "message_id": request_id,
+            "from": get_header_value(headers, "From"),
+            "subject": get_header_value(headers, "Subject"),
+            "labels": response.get("labelIds", []),
+        }
+
+    # Batch HTTP Gmail : jusqu'à 100 requêtes par aller-retour.
+    for start in range(0, len(message_ids), 100):
+        batch = gmail.new_batch_http_request(callback=on_response)
+        for message_id in message_ids[start : start + 100]:
+            batch.add(
+                gmail.users()
+                .messages()
+                .get(userId="me", id=message_id, format="metadata", metadataHeaders=["From", "Subject"]),
+                request_id=message_id,
+            )
+        batch.execute()
+    if failed:
+        error = describe_error(next(iter(failed.values())))
+        raise GmailMetadataError(f"Lecture Gmail incomplète ({len(failed)} message(s) en erreur) : {error}")
+    return found
+
+
+def run_gmail_action(snapshot: ActionSnapshot, applet: AppletEntry) -> dict | None:
+    message_ids = snapshot.gmail_message_ids()
+    if not message_ids:
         return None
-    event_id = events[0]["id"]
-    if applet.last_action_marker == event_id:
+    predicate = applet.compiled_filter()
+    if predicate is filters.match_all and applet.last_action_marker == message_ids[0]:
         return None
-    return {"event_id": event_id, "calendar_id": calendar_id}
+    for message in snapshot.gmail_messages():
+        if not predicate(message):
+            continue
+        if applet.last_action_marker == message["message_id"]:
+            return None
+        return {"message_id": message["message_id"], "from": message["from"], "subject": message["subject"]}
+    return None
 
 
-def mark_gmail_read(credentials: Credentials, message_id: str):
-    gmail = build("gmail", "v1", credentials=credentials)
-    gmail.users().messages().modify(
-        userId="me", id=message_id, body={"removeLabelIds": ["UNREAD"]}
-    ).execute()
+def run_calendar_action(snapshot: ActionSnapshot, applet: AppletEntry) -> dict | None:
+    calendar_id = applet.action_config.get("calendar") or "primary"
+    predicate = applet.compiled_filter()
+    for event in snapshot.calendar_events(calendar_id):
+        if not predicate(event):
+            continue
+        if applet.last_action_marker == event["event_id"]:
+            return None
+        return {"event_id": event["event_id"], "calendar_id": calendar_id}
+    return None
 
 
-def run_gmail_reaction(credentials: Credentials, config: dict):
-    gmail = build("gmail", "v1", credentials=credentials)
+def run_gmail_reaction(gmail, config: dict, http=None):
     msg = EmailMessage()
     msg["To"] = config.get("to", "")
     msg["Subject"] = config.get("subject", "")
     msg.set_content(config.get("message", ""))
     raw = base64.urlsafe_b64encode(msg.as_bytes()).decode()
-    gmail.users().messages().send(userId="me", body={"raw": raw}).execute()
+    gmail.users().messages().send(userId="me", body={"raw": raw}).execute(http=http)
 
 
-def run_calendar_reaction(credentials: Credentials, config: dict):
-    calendar = build("calendar", "v3", credentials=credentials)
+def run_calendar_reaction(calendar, config: dict, http=None):
     event = {
         "summary": config.get("title", "Nouvel évènement"),
         "start": {"date": config.get("start_date")},
         "end": {"date": config.get("end_date")},
     }
-    calendar.events().insert(calendarId="primary", body=event).execute()
+    calendar.events().insert(calendarId="primary", body=event).execute(http=http)
+
+
+def describe_error(exc: Exception) -> str:
+    return normalize_error_message(exc.detail if isinstance(exc, HTTPException) else str(exc))
+
+
+class PendingReaction:
+    __slots__ = ("applet", "payload", "config", "marker", "previous_marker", "claimed_version")
+
+    def __init__(self, applet: AppletEntry, payload: dict, config: dict):
+        self.applet = applet
+        self.payload = payload
+        self.config = config
+        self.marker: str | None = None
+        self.previous_marker = applet.last_action_marker
+        self.claimed_version = applet.version + 1
+
+
+def evaluate_action(snapshot: ActionSnapshot, applet: AppletEntry) -> dict | None:
+    if applet.action_choice == "gmail_new_mail":
+        return run_gmail_action(snapshot, applet)
+    if applet.action_choice == "agenda_new_event":
+        return run_calendar_action(snapshot, applet)
+    return None
+
+
+def render_reaction_config(applet: AppletEntry, payload: dict, user_email: str) -> dict:
+    config = applet.compiled_reaction().render(build_template_context(payload, user_email))
+    if applet.reaction_choice == "gmail_send_mail":
+        if not config.get("to") and user_email:
+            config["to"] = user_email
+        if not config.get("to"):
+            raise HTTPException(status_code=400, detail="La réaction Gmail nécessite un destinataire")
+    return config
+
+
+def run_reaction(snapshot: ActionSnapshot, pending: PendingReaction):
+    with profiling.span("reaction", pending.applet.id):
+        if pending.applet.reaction_choice == "gmail_send_mail":
+            run_gmail_reaction(snapshot.gmail, pending.config, snapshot.http())
+        if pending.applet.reaction_choice == "agenda_create_event":
+            run_calendar_reaction(snapshot.calendar, pending.config, snapshot.http())
 
 
 def run_applets_for_user(db: Session, user_id: int) -> list[dict]:
-    applets = (
-        db.query(models.Applet)
-        .filter(models.Applet.user_id == user_id, models.Applet.is_active.is_(True))
-        .all()
-    )
-    if not applets:
+    entry = applet_index.get_current_user(db, user_id)
+    if not entry or not entry.applets:
         return []
+    applets = entry.applets
+
+    with profiling.run_trace(user_id):
+        with profiling.span("lease"):
+            lease = leases.acquire_user_lease(db, user_id)
+        if not lease:
+            return [{"id": applet.id, "status": "busy"} for applet in applets]
+        try:
+            return execute_user_applets(db, user_id, applets, lease, entry.email or "")
+        finally:
+            with profiling.span("lease"):
+                leases.release_user_lease(db, user_id, lease)
+
+
+def set_google_suspended(db: Session, user_id: int, suspended_at: datetime | None):
+    # Le disjoncteur est local au process : la suspension est aussi écrite sur le token en base (dans la
+    # transaction qui incrémente la version "google"), pour que tous les workers servent le même statut.
+    db.execute(
+        update(models.ServiceToken)
+        .where(models.ServiceToken.user_id == user_id, models.ServiceToken.provider == "google")
+        .values(suspended_at=suspended_at),
+        execution_options={"synchronize_session": False},
+    )
 
-    user_email = db.query(models.User.email).filter(models.User.id == user_id).scalar() or ""
 
+def execute_user_applets(
+    db: Session, user_id: int, applets: tuple[AppletEntry, ...], lease: str, user_email: str
+) -> list[dict]:
+    if breaker.is_open(user_id, "google"):
+        breaker.reset_if_token_changed(user_id, "google", applet_index.current_google_token_key(db, user_id))
+    if not breaker.allow(user_id, "google"):
+        return [{"id": applet.id, "status": "suspended"} for applet in applets]
     try:
-        credentials = get_google_credentials(db, user_id)
+        with profiling.span("credentials"):
+            credentials = get_google_credentials(db, user_id)
     except Exception as exc:
-        message = normalize_error_message(str(exc))
-        results = []
-        for applet in applets:
-            log_applet(db, user_id, applet.id, "error", message)
-            results.append({"id": applet.id, "status": "error"})
-        return results
-
-    results = []
+        message = describe_error(exc)
+        if is_auth_failure(exc):
+            was_open = breaker.is_open(user_id, "google")
+            token = applet_index.get_google_token(db, user_id)
+            cooldown = breaker.record_failure(user_id, "google", token.key if token else None)
+            if cooldown is not None:
+                # Une seule entrée au changement d'état, au lieu d'une erreur par applet à chaque tick.
+                suspended = f"{message} Applets suspendues {cooldown}s (reprise à la reconnexion Google)."
+                set_google_suspended(db, user_id, datetime.utcnow())
+                versions.bump(db, user_id, versions.GOOGLE)
+                log_applet(db, user_id, applets[0].id, "error", suspended[:255])
+            if was_open or cooldown is not None:
+                return [{"id": applet.id, "status": "suspended"} for applet in applets]
+        commit_applet_logs(db, user_id, [add_applet_log(db, user_id, applet.id, "error", message) for applet in applets])
+        return [{"id": applet.id, "status": "error"} for applet in applets]
+    if breaker.record_success(user_id, "google"):
+        set_google_suspended(db, user_id, None)
+        versions.bump(db, user_id, versions.GOOGLE)
+        db.commit()
+
+    snapshot = ActionSnapshot(credentials, applets)
+    outcomes: dict[int, tuple[str, str | None]] = {}
+    pending = prepare_reactions(db, user_id, snapshot, applets, user_email, outcomes)
+    errors: dict[int, BaseException | None] = {}
+    try:
+        fire_reactions(db, user_id, snapshot, pending, lease, errors)
+        return record_outcomes(db, user_id, snapshot, applets, pending, errors, outcomes)
+    except Exception:
+        db.rollback()
+        release_unfinished_claims(pending, errors)
+        raise
+
+
+def prepare_reactions(
+    db: Session,
+    user_id: int,
+    snapshot: ActionSnapshot,
+    applets: tuple[AppletEntry, ...],
+    user_email: str,
+    outcomes: dict[int, tuple[str, str | None]],
+) -> list[PendingReaction]:
+    # Phase 1 : actions évaluées sur le snapshot (appels Google) sans aucune écriture, puis réservation
+    # de tous les marqueurs (compare-and-set) enchaînée et validée aussitôt : sous SQLite, le verrou
+    # d'écriture n'est jamais tenu pendant un appel réseau.
+    evaluated: list[PendingReaction] = []
     for applet in applets:
-        action_config = json.loads(applet.action_config or "{}")
-        reaction_config = json.loads(applet.reaction_config or "{}")
         try:
-            action_payload = None
-            if applet.action_choice == "gmail_new_mail":
-                action_payload = run_gmail_action(credentials, applet, db, action_config)
-            if applet.action_choice == "agenda_new_event":
-                action_payload = run_calendar_action(credentials, applet, db, action_config)
-
-            if not action_payload:
-                log_applet(db, user_id, applet.id, "skipped", "Aucune nouvelle action")
-                results.append({"id": applet.id, "status": "skipped"})
+            with profiling.span("action_fetch", applet.id):
+                payload = evaluate_action(snapshot, applet)
+            if not payload:
+                outcomes[applet.id] = ("skipped", "Aucune nouvelle action")
                 continue
-
-            if applet.reaction_choice == "gmail_send_mail":
-                if not reaction_config.get("to") and action_payload.get("from"):
-                    reaction_config["to"] = extract_email_address(action_payload["from"])
-                if not reaction_config.get("to") and user_email:
-                    reaction_config["to"] = user_email
-                if not reaction_config.get("subject") and action_payload.get("subject"):
-                    reaction_config["subject"] = f"RE: {action_payload['subject']}"
-                if not reaction_config.get("message"):
-                    reaction_config["message"] = "Message automatique envoyé par AREA."
-                if not reaction_config.get("to"):
-                    raise HTTPException(status_code=400, detail="La réaction Gmail nécessite un destinataire")
-                run_gmail_reaction(credentials, reaction_config)
-                if action_payload.get("message_id"):
-                    try:
-                        mark_gmail_read(credentials, action_payload["message_id"])
-                    except Exception:
-                        pass
-            if applet.reaction_choice == "agenda_create_event":
-                run_calendar_reaction(credentials, reaction_config)
-
-            marker = action_payload.get("message_id") or action_payload.get("event_id")
-            if marker:
-                applet.last_action_marker = str(marker)
-                db.commit()
-
-            log_applet(db, user_id, applet.id, "success", "Réaction exécutée")
-            results.append({"id": applet.id, "status": "success"})
+            evaluated.append(PendingReaction(applet, payload, render_reaction_config(applet, payload, user_email)))
         except Exception as exc:
-            detail = exc.detail if isinstance(exc, HTTPException) else str(exc)
-            log_applet(db, user_id, applet.id, "error", normalize_error_message(detail))
-            results.append({"id": applet.id, "status": "error"})
-    return results
-
-
-@router.post("/run")
-def run_applets(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+            outcomes[applet.id] = ("error", describe_error(exc))
+
+    pending: list[PendingReaction] = []
+    lost: list[AppletEntry] = []
+    for reaction in evaluated:
+        marker = reaction.payload.get("message_id") or reaction.payload.get("event_id")
+        if marker:
+            if not claim_action_marker(db, reaction.applet.id, reaction.applet.version, str(marker)):
+                lost.append(reaction.applet)
+                continue
+            reaction.marker = str(marker)
+        pending.append(reaction)
+    with profiling.span("marker_commit"):
+        db.commit()
+    for applet in lost:
+        applet_index.refresh_applet(db, user_id, applet.id)
+        outcomes[applet.id] = ("skipped", "Aucune nouvelle action")
+    for reaction in pending:
+        if reaction.marker:
+            reaction.applet.version = reaction.claimed_version
+            reaction.applet.last_action_marker = reaction.marker
+    return pending
+
+
+def fire_reactions(
+    db: Session,
+    user_id: int,
+    snapshot: ActionSnapshot,
+    pending: list[PendingReaction],
+    lease: str,
+    errors: dict[int, BaseException | None],
 ):
-    results = run_applets_for_user(db, current_user.id)
-    return {"results": results}
+    # Phase 2 : réactions en parallèle (au plus APPLET_USER_CONCURRENCY par utilisateur). Le thread
+    # appelant renouvelle le bail pendant l'attente ; s'il est perdu, les réactions pas encore
+    # démarrées sont annulées. errors est rempli au fil de l'eau : il reste exploitable si on sort en erreur.
+    if not pending:
+        return
+    # Services construits avant la fan-out : un seul chargement discovery, partagé par les threads.
+    if any(reaction.applet.reaction_choice == "gmail_send_mail" for reaction in pending):
+        snapshot.gmail
+    if any(reaction.applet.reaction_choice == "agenda_create_event" for reaction in pending):
+        snapshot.calendar
+
+    react = profiling.bind(run_reaction)
+    workers = min(USER_CONCURRENCY, len(pending))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"applet-user-{user_id}") as executor:
+        futures = {executor.submit(react, snapshot, reaction): reaction for reaction in pending}
+        waiting = set(futures)
+        try:
+            while waiting:
+                done, waiting = wait(waiting, timeout=leases.LEASE_SECONDS / 2)
+                collect_reaction_errors(futures, done, errors)
+                if waiting:
+                    with profiling.span("lease"):
+                        renewed = leases.renew_user_lease(db, user_id, lease)
+                    if not renewed:
+                        for future in waiting:
+                            future.cancel()
+        except BaseException:
+            # Renouvellement du bail en échec : plus rien n'est lancé, on attend les réactions déjà en cours
+            # pour savoir lesquelles ont réellement été envoyées.
+            for future in waiting:
+                future.cancel()
+            executor.shutdown(wait=True)
+            collect_reaction_errors(futures, waiting, errors)
+            raise
+
+
+def collect_reaction_errors(futures: dict, done, errors: dict[int, BaseException | None]):
+    for future in done:
+        applet_id = futures[future].applet.id
+        errors[applet_id] = CancelledError() if future.cancelled() else future.exception()
+
+
+def release_unfinished_claims(pending: list[PendingReaction], errors: dict[int, BaseException | None]):
+    # Sortie en erreur entre la réservation et le commit des logs : les marqueurs des réactions qui n'ont
+    # pas abouti sont rendus dans une transaction neuve, sinon leurs actions seraient perdues.
+    unfinished = [
+        reaction
+        for reaction in pending
+        if reaction.marker and (reaction.applet.id not in errors or errors[reaction.applet.id] is not None)
+    ]
+    if not unfinished:
+        return
+    db = SessionLocal()
+    try:
+        for reaction in unfinished:
+            release_action_marker(db, reaction.applet.id, reaction.claimed_version, reaction.previous_marker)
+        db.commit()
+    finally:
+        db.close()
+    for reaction in unfinished:
+        reaction.applet.version = reaction.claimed_version + 1
+        reaction.applet.last_action_marker = reaction.previous_marker
+
+
+def record_outcomes(
+    db: Session,
+    user_id: int,
+    snapshot: ActionSnapshot,
+    applets: tuple[AppletEntry, ...],
+    pending: list[PendingReaction],
+    errors: dict[int, BaseException | None],
+    outcomes: dict[int, tuple[str, str | None]],
+) -> list[dict]:
+    # Phase 3 : logs et libération des marqueurs des réactions en échec dans une seule transaction.
+    released: list[PendingReaction] = []
+    read_markers: dict[str, int] = {}
+    for reaction in pending:
+        applet = reaction.applet
+        error = errors.get(applet.id)
+        if error is None:
+            outcomes[applet.id] = ("success", "Réaction exécutée")
+            message_id = reaction.payload.get("message_id")
+            if applet.reaction_choice == "gmail_send_mail" and message_id:
+                snapshot.gmail_modifications.mark_read(message_id)
+                read_markers[message_id] = applet.id
+            continue
+        if reaction.marker:
+            release_action_marker(db, applet.id, reaction.claimed_version, reaction.previous_marker)
+            released.append(reaction)
+        # Annulée faute de bail : rien n'a été envoyé, l'applet sera reprise au prochain passage.
+        outcomes[applet.id] = ("busy", None) if isinstance(error, CancelledError) else ("error", describe_error(error))
+
+    logs = [
+        add_applet_log(db, user_id, applet.id, *outcomes[applet.id])
+        for applet in applets
+        if outcomes[applet.id][1] is not None
+    ]
+    commit_applet_logs(db, user_id, logs)
+    for reaction in released:
+        reaction.applet.version = reaction.claimed_version + 1
+        reaction.applet.last_action_marker = reaction.previous_marker
+
+    results = {applet.id: {"id": applet.id, "status": outcomes[applet.id][0]} for applet in applets}
+    # Marquage "lu" groupé en fin d'exécution ; un échec reste non bloquant, mais est signalé par message.
+    with profiling.span("gmail_modify"):
+        failed_modifications = snapshot.gmail_modifications.flush()
+    for message_id, error in failed_modifications.items():
+        if message_id in read_markers:
+            results[read_markers[message_id]]["warning"] = normalize_error_message(error)
+    return list(results.values())
+
+
+@router.post("/run", response_model=schemas.AppletRunJobOut, status_code=status.HTTP_202_ACCEPTED)
+def run_applets(current_user: models.User = Depends(get_current_user)):
+    job = jobs.runner.submit(current_user.id, run_applets_for_user)
+    return job.to_dict()
+
+
+@router.get("/run/{job_id}", response_model=schemas.AppletRunJobOut)
+def get_run_job(job_id: str, current_user: models.User = Depends(get_current_user)):
+    job = jobs.runner.get(job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Exécution introuvable")
+    return job.to_dict()
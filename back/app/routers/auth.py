@@ -1,50 +1,43 @@
-import os
-from pathlib import Path
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from functools import lru_cache
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from fastapi.responses import RedirectResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import jwt
-from authlib.integrations.starlette_client import OAuth
-from authlib.integrations.base_client.errors import MismatchingStateError, OAuthError
-import httpx
-from dotenv import load_dotenv
 from sqlalchemy.orm import Session
 
 from ..database import SessionLocal
-from .. import models, schemas
+from .. import models, schemas, versions
+from ..applet_index import index as applet_index
+from ..breaker import breaker
+from ..config import get_env
 from ..security import hash_password, verify_password, create_access_token, SECRET_KEY, ALGORITHM
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 security = HTTPBearer()
 
-ENV_PATH = Path(__file__).resolve().parents[2] / ".env"
-load_dotenv(dotenv_path=ENV_PATH, override=True)
-
-
-def get_env(name: str) -> str | None:
-    value = os.getenv(name)
-    if value is None:
-        return None
-    return value.strip()
-
-
 def get_backend_url_from_request(request: Request) -> str:
     host = request.headers.get("host")
     if host:
         return f"{request.url.scheme}://{host}".rstrip("/")
     return str(request.base_url).rstrip("/")
 
-oauth = OAuth()
-oauth.register(
-    name="google",
-    client_id=get_env("GOOGLE_CLIENT_ID"),
-    client_secret=get_env("GOOGLE_CLIENT_SECRET"),
-    server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
-    client_kwargs={
-        "scope": "openid email profile https://www.googleapis.com/auth/gmail.readonly https://www.googleapis.com/auth/gmail.modify https://www.googleapis.com/auth/gmail.send https://www.googleapis.com/auth/calendar.readonly https://www.googleapis.com/auth/calendar.events",
-        "token_endpoint_auth_method": "client_secret_post",
-    },
-)
+@lru_cache(maxsize=1)
+def get_oauth():
+    # Authlib (et httpx derrière lui) n'est importé qu'au premier passage par le flow Google.
+    from authlib.integrations.starlette_client import OAuth
+
+    oauth = OAuth()
+    oauth.register(
+        name="google",
+        client_id=get_env("GOOGLE_CLIENT_ID"),
+        client_secret=get_env("GOOGLE_CLIENT_SECRET"),
+        server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
+        client_kwargs={
+            "scope": "openid email profile https://www.googleapis.com/auth/gmail.readonly https://www.googleapis.com/auth/gmail.modify https://www.googleapis.com/auth/gmail.send https://www.googleapis.com/auth/calendar.readonly https://www.googleapis.com/auth/calendar.events",
+            "token_endpoint_auth_method": "client_secret_post",
+        },
+    )
+    return oauth
 
 
 def get_db():
@@ -59,12 +52,25 @@ def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db),
 ):
-    token = credentials.credentials
+    return get_user_from_token(db, credentials.credentials)
+
+
+def get_admin_user(current_user: models.User = Depends(get_current_user)):
+    admin_emails = {email.strip().lower() for email in (get_env("ADMIN_EMAILS") or "").split(",") if email.strip()}
+    if current_user.email.lower() not in admin_emails:
+        raise HTTPException(status_code=403, detail="Accès réservé aux administrateurs")
+    return current_user
+
+
+def get_user_from_token(db: Session, token: str, scope: str | None = None) -> models.User:
+    # Un token de flux (scope "events") n'est pas accepté comme token d'accès, et inversement.
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = int(payload.get("sub"))
     except Exception as exc:
         raise HTTPException(status_code=401, detail="Token invalide") from exc
+    if payload.get("scope") != scope:
+        raise HTTPException(status_code=401, detail="Token invalide")
 
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
@@ -115,7 +121,7 @@ async def google_login(request: Request):
     request.session.clear()
     backend_url = get_backend_url_from_request(request)
     redirect_uri = f"{backend_url}/auth/google/callback"
-    return await oauth.google.authorize_redirect(
+    return await get_oauth().google.authorize_redirect(
         request,
         redirect_uri,
         access_type="offline",
@@ -128,6 +134,7 @@ async def google_login(request: Request):
 def google_debug(request: Request):
     backend_url = get_backend_url_from_request(request)
     secret = get_env("GOOGLE_CLIENT_SECRET") or ""
+    oauth = get_oauth()
     client_secret = oauth.google.client_secret or ""
     return {
         "google_client_id": get_env("GOOGLE_CLIENT_ID"),
@@ -147,9 +154,15 @@ def google_debug(request: Request):
 
 @router.get("/google/status")
 def google_status(
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
+    cached, headers = versions.not_modified(db, request, current_user.id, versions.GOOGLE)
+    if cached:
+        return cached
+    response.headers.update(headers)
     token = (
         db.query(models.ServiceToken)
         .filter(models.ServiceToken.user_id == current_user.id, models.ServiceToken.provider == "google")
@@ -160,6 +173,7 @@ def google_status(
         "connected": bool(token),
         "has_refresh_token": bool(token and token.refresh_token),
         "created_at": token.created_at if token else None,
+        "suspended": bool(token and token.suspended_at),
     }
 
 
@@ -168,6 +182,8 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
     backend_url = get_backend_url_from_request(request)
     redirect_uri = f"{backend_url}/auth/google/callback"
     async def manual_exchange(auth_code: str):
+        import httpx
+
         token_endpoint = "https://oauth2.googleapis.com/token"
         async with httpx.AsyncClient() as client:
             response = await client.post(
@@ -189,6 +205,9 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
             raise HTTPException(status_code=400, detail=detail)
         return data
 
+    from authlib.integrations.base_client.errors import MismatchingStateError, OAuthError
+
+    oauth = get_oauth()
     try:
         token = await oauth.google.authorize_access_token(request)
     except MismatchingStateError:
@@ -246,10 +265,13 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
         refresh_token=refresh_token,
     )
     db.add(service_token)
+    versions.bump(db, user.id, versions.GOOGLE)
     db.commit()
+    applet_index.invalidate_google_token(user.id)
+    breaker.reset(user.id, "google")
 
     jwt_token = create_access_token(subject=str(user.id))
-    redirect_front = os.getenv("FRONTEND_URL", "http://localhost:5173")
+    redirect_front = get_env("FRONTEND_URL", "http://localhost:5173")
     return_url = f"{redirect_front}/index.html?token={jwt_token}&first_name={user.first_name}"
     return RedirectResponse(url=return_url, status_code=302)
 
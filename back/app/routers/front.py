@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import RedirectResponse
+from starlette.responses import Response
+
+from ..static_assets import get_bundle, negotiate
+
+router = APIRouter(prefix="/app", include_in_schema=False)
+
+
+@router.get("")
+def front_root():
+    return RedirectResponse("/app/", status_code=308)
+
+
+@router.api_route("/{path:path}", methods=["GET", "HEAD"])
+async def front_asset(path: str, request: Request):
+    asset = get_bundle().get(path or "index.html")
+    if asset is None:
+        return Response(status_code=404)
+
+    vary = [header for header, varies in (("Accept", asset.webp), ("Accept-Encoding", asset.encodings)) if varies]
+    asset, body, encoding = negotiate(
+        asset,
+        request.headers.get("accept", ""),
+        request.headers.get("accept-encoding", ""),
+    )
+    etag = asset.etag if encoding is None else f'{asset.etag[:-1]}-{encoding}"'
+    headers = {"ETag": etag, "Cache-Control": asset.cache_control}
+    if vary:
+        headers["Vary"] = ", ".join(vary)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    if request.method == "HEAD":
+        headers["Content-Length"] = str(len(body))
+        return Response(status_code=200, headers=headers, media_type=asset.media_type)
+    return Response(body, headers=headers, media_type=asset.media_type)
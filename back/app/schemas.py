@@ -31,6 +31,11 @@ class Token(BaseModel):
     user: UserOut
 
 
+class StreamToken(BaseModel):
+    token: str
+    expires_in: int
+
+
 class UserUpdate(BaseModel):
     first_name: str | None = None
     last_name: str | None = None
@@ -75,3 +80,29 @@ class AppletLogOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class AppletRunResult(BaseModel):
+    id: int
+    status: str
+    warning: str | None = None
+
+
+class AppletRunJobOut(BaseModel):
+    job_id: str
+    status: str
+    source: str
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    results: list[AppletRunResult] | None = None
+    error: str | None = None
+
+
+class ProfileTicksIn(BaseModel):
+    count: int = Field(default=1, ge=1, le=100)
+
+
+class ProfileSlowRequestsIn(BaseModel):
+    threshold_ms: int = Field(ge=1)
+    duration_seconds: int = Field(default=600, ge=1, le=86400)
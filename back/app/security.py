@@ -1,29 +1,40 @@
-import os
-from pathlib import Path
 from datetime import datetime, timedelta
+from functools import lru_cache
 from jose import jwt
-from passlib.context import CryptContext
-from dotenv import load_dotenv
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from .config import get_env
 
-ENV_PATH = Path(__file__).resolve().parents[1] / ".env"
-load_dotenv(dotenv_path=ENV_PATH, override=True)
-
-SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-change-me")
+SECRET_KEY = get_env("SECRET_KEY", "dev-secret-change-me")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
+STREAM_TOKEN_EXPIRE_SECONDS = 60
+STREAM_SCOPE = "events"
+
+
+@lru_cache(maxsize=1)
+def get_pwd_context():
+    # passlib/bcrypt ne sont chargés qu'au premier login/register.
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 
 def create_access_token(subject: str) -> str:
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode = {"sub": subject, "exp": expire}
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def create_stream_token(subject: str) -> str:
+    # Token court, limité au flux SSE : c'est lui qui passe en query string (et donc dans les logs d'accès).
+    expire = datetime.utcnow() + timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+    to_encode = {"sub": subject, "exp": expire, "scope": STREAM_SCOPE}
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
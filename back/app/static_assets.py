@@ -0,0 +1,174 @@
+import gzip
+import hashlib
+import io
+import mimetypes
+import re
+from pathlib import Path
+
+from .compression import accepted_encodings
+from .config import get_env, get_env_int
+
+FRONT_DIR = Path(get_env("FRONT_DIR") or Path(__file__).resolve().parents[2] / "front")
+IMAGE_MAX_WIDTH = get_env_int("STATIC_IMAGE_MAX_WIDTH", 480)
+WEBP_QUALITY = get_env_int("STATIC_WEBP_QUALITY", 80)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+PAGE_SUFFIXES = (".html",)
+# Ordre de construction : un fichier est haché après réécriture des fichiers qu'il référence.
+TEXT_SUFFIXES = (".css", ".js", ".html")
+BINARY_SUFFIXES = (".png", ".webp", ".jpg", ".jpeg", ".svg", ".ico")
+COMPRESSIBLE_SUFFIXES = (".css", ".js", ".html", ".svg")
+WEBP_SOURCE_SUFFIXES = (".png", ".jpg", ".jpeg")
+
+
+class StaticAsset:
+    __slots__ = ("path", "media_type", "body", "etag", "cache_control", "encodings", "webp")
+
+    def __init__(self, path: str, media_type: str, body: bytes, cache_control: str):
+        self.path = path
+        self.media_type = media_type
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        self.cache_control = cache_control
+        self.encodings: dict[str, bytes] = {}
+        self.webp: StaticAsset | None = None
+
+
+def content_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()[:10]
+
+
+def hashed_path(path: str, body: bytes) -> str:
+    stem, dot, suffix = path.rpartition(".")
+    return f"{stem}.{content_hash(body)}.{suffix}" if dot else f"{path}.{content_hash(body)}"
+
+
+def compress_variants(body: bytes) -> dict[str, bytes]:
+    # Variantes précompressées au build : seules celles qui réduisent réellement la taille sont gardées.
+    variants = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        variants["br"] = brotli.compress(body, quality=11)
+    return {encoding: data for encoding, data in variants.items() if len(data) < len(body)}
+
+
+def webp_variant(body: bytes) -> bytes | None:
+    # Pillow est optionnel : sans lui les images sont servies telles quelles.
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    with Image.open(io.BytesIO(body)) as image:
+        image.load()
+        if image.width > IMAGE_MAX_WIDTH:
+            height = round(image.height * IMAGE_MAX_WIDTH / image.width)
+            image = image.resize((IMAGE_MAX_WIDTH, height), Image.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        output = io.BytesIO()
+        image.save(output, "WEBP", quality=WEBP_QUALITY, method=4)
+    data = output.getvalue()
+    return data if len(data) < len(body) else None
+
+
+def rewrite_references(text: str, manifest: dict[str, str]) -> str:
+    # Remplace les chemins relatifs connus ("assets/x.png", "styles.css?v=...") par leur URL hachée.
+    if not manifest:
+        return text
+    names = "|".join(re.escape(path) for path in sorted(manifest, key=len, reverse=True))
+    pattern = re.compile(rf"(?<=[\"'(])(?:\./)?({names})(?:\?v=[\w.-]*)?(?=[\"')])")
+    return pattern.sub(lambda match: manifest[match.group(1)], text)
+
+
+def media_type_for(path: str) -> str:
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type == "application/javascript":
+        media_type += "; charset=utf-8"
+    return media_type
+
+
+class StaticBundle:
+    def __init__(self):
+        self.assets: dict[str, StaticAsset] = {}
+        self.manifest: dict[str, str] = {}
+        self.source_bytes = 0
+
+    @classmethod
+    def build(cls, root: Path = FRONT_DIR) -> "StaticBundle":
+        bundle = cls()
+        files = {path.relative_to(root).as_posix(): path for path in sorted(root.rglob("*")) if path.is_file()}
+        for name, path in files.items():
+            if name.lower().endswith(BINARY_SUFFIXES):
+                bundle.add(name, path.read_bytes())
+        for suffix in TEXT_SUFFIXES:
+            for name, path in files.items():
+                if name.endswith(suffix):
+                    text = rewrite_references(path.read_text(encoding="utf-8"), bundle.manifest)
+                    bundle.add(name, text.encode("utf-8"), source_size=path.stat().st_size)
+        return bundle
+
+    def add(self, name: str, body: bytes, source_size: int | None = None):
+        self.source_bytes += len(body) if source_size is None else source_size
+        media_type = media_type_for(name)
+        lower = name.lower()
+        webp = webp_variant(body) if lower.endswith(WEBP_SOURCE_SUFFIXES) else None
+        encodings = compress_variants(body) if lower.endswith(COMPRESSIBLE_SUFFIXES) else {}
+
+        # Les pages restent à leur URL (points d'entrée) et sont revalidées via ETag ;
+        # tout le reste est aussi exposé sous une URL hachée, cacheable indéfiniment.
+        paths = [(name, REVALIDATE)]
+        if not lower.endswith(PAGE_SUFFIXES):
+            versioned = hashed_path(name, body + (webp or b""))
+            self.manifest[name] = versioned
+            paths.append((versioned, IMMUTABLE))
+        for path, cache_control in paths:
+            asset = StaticAsset(path, media_type, body, cache_control)
+            asset.encodings = encodings
+            if webp:
+                asset.webp = StaticAsset(path, "image/webp", webp, cache_control)
+            self.assets[path] = asset
+
+    def get(self, path: str) -> StaticAsset | None:
+        return self.assets.get(path)
+
+    def served_bytes(self, encoding: str | None = "br", webp: bool = True) -> int:
+        # Octets d'un premier chargement complet (une version de chaque fichier source).
+        total = 0
+        for name in self.manifest.keys() | {path for path in self.assets if path.endswith(PAGE_SUFFIXES)}:
+            asset = self.assets[name]
+            if webp and asset.webp:
+                asset = asset.webp
+            body = asset.encodings.get(encoding) if encoding else None
+            total += len(body or asset.body)
+        return total
+
+
+def negotiate(asset: StaticAsset, accept: str, accept_encoding: str) -> tuple[StaticAsset, bytes, str | None]:
+    if asset.webp and "image/webp" in accept:
+        asset = asset.webp
+    if asset.encodings:
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in asset.encodings:
+                return asset, asset.encodings[encoding], encoding
+    return asset, asset.body, None
+
+
+_bundle: StaticBundle | None = None
+
+
+def load_bundle(root: Path = FRONT_DIR) -> StaticBundle:
+    global _bundle
+    _bundle = StaticBundle.build(root)
+    return _bundle
+
+
+def get_bundle() -> StaticBundle:
+    if _bundle is None:
+        return load_bundle()
+    return _bundle
@@ -0,0 +1,61 @@
+import re
+
+VARIABLE_PATTERN = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+VARIABLES = frozenset({"from", "from_email", "subject", "message_id", "event_id", "calendar_id", "user_email"})
+
+# Valeurs utilisées quand le champ de la réaction est vide (anciens fallbacks codés en dur).
+DEFAULTS = {
+    "gmail_send_mail": {
+        "to": "{{from_email}}",
+        "subject": "RE: {{subject}}",
+        "message": "Message automatique envoyé par AREA.",
+    },
+}
+
+
+class Template:
+    __slots__ = ("parts", "blank_if_empty")
+
+    def __init__(self, source: str, blank_if_empty: bool = False):
+        # re.split alterne texte littéral (index pairs) et noms de variables (index impairs).
+        self.parts = tuple(VARIABLE_PATTERN.split(source))
+        self.blank_if_empty = blank_if_empty
+
+    @property
+    def variables(self) -> tuple[str, ...]:
+        return self.parts[1::2]
+
+    def render(self, context: dict[str, str]) -> str:
+        parts = self.parts
+        if len(parts) == 1:
+            return parts[0]
+        if self.blank_if_empty and not any(context.get(name) for name in parts[1::2]):
+            return ""
+        return "".join(part if index % 2 == 0 else context.get(part, "") for index, part in enumerate(parts))
+
+
+class CompiledReaction:
+    __slots__ = ("fields",)
+
+    def __init__(self, reaction_choice: str, config: dict):
+        fields = {}
+        for key, value in config.items():
+            fields[key] = Template(value) if isinstance(value, str) else value
+        for key, source in DEFAULTS.get(reaction_choice, {}).items():
+            if not config.get(key):
+                fields[key] = Template(source, blank_if_empty=True)
+        self.fields = fields
+
+    def render(self, context: dict[str, str]) -> dict:
+        return {
+            key: value.render(context) if isinstance(value, Template) else value
+            for key, value in self.fields.items()
+        }
+
+
+def unknown_variables(config: dict) -> list[str]:
+    unknown = set()
+    for value in config.values():
+        if isinstance(value, str):
+            unknown.update(name for name in Template(value).variables if name not in VARIABLES)
+    return sorted(unknown)
@@ -0,0 +1,104 @@
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+from fastapi import Request
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.responses import Response
+
+from . import models
+
+APPLETS = "applets"
+LOGS = "logs"
+GOOGLE = "google"
+
+
+def _insert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def bump(db: Session, user_id: int, scope: str):
+    # Exécuté dans la transaction de l'écriture, sans commit : la nouvelle version devient visible
+    # de tous les workers/process au même moment que les données.
+    now = datetime.utcnow()
+    statement = _insert(db)(models.ResourceVersion).values(user_id=user_id, scope=scope, version=1, changed_at=now)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["user_id", "scope"],
+            set_={"version": models.ResourceVersion.version + 1, "changed_at": now},
+        )
+    )
+
+
+def current(db: Session, user_id: int, scope: str) -> tuple[int, datetime | None]:
+    row = db.execute(
+        select(models.ResourceVersion.version, models.ResourceVersion.changed_at).where(
+            models.ResourceVersion.user_id == user_id, models.ResourceVersion.scope == scope
+        )
+    ).first()
+    return (row.version, row.changed_at) if row else (0, None)
+
+
+def make_etag(user_id: int, scope: str, version: int, changed_at: datetime | None) -> str:
+    # L'horodatage évite qu'un ETag survive à une base recréée dont les compteurs repartent de zéro.
+    stamp = changed_at.strftime("%Y%m%d%H%M%S%f") if changed_at else "0"
+    return f'W/"{scope}-{user_id}-{version}-{stamp}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _settled(changed_at: datetime | None) -> bool:
+    # Last-Modified est à la seconde : tant que la seconde de la dernière écriture n'est pas
+    # écoulée, une autre écriture peut encore porter la même date. Pas de validation par date avant.
+    return changed_at is not None and changed_at < datetime.utcnow().replace(microsecond=0)
+
+
+def _cache_headers(user_id: int, scope: str, version: int, changed_at: datetime | None) -> dict[str, str]:
+    headers = {
+        "ETag": make_etag(user_id, scope, version, changed_at),
+        "Cache-Control": "private, no-cache",
+        "Vary": "Authorization",
+    }
+    if _settled(changed_at):
+        headers["Last-Modified"] = changed_at.strftime("%a, %d %b %Y %H:%M:%S GMT")
+    return headers
+
+
+def cache_headers(db: Session, user_id: int, scope: str) -> dict[str, str]:
+    return _cache_headers(user_id, scope, *current(db, user_id, scope))
+
+
+def not_modified(db: Session, request: Request, user_id: int, scope: str) -> tuple[Response | None, dict[str, str]]:
+    # Une seule lecture par clé primaire avant la requête du listing ; renvoie aussi les en-têtes
+    # de cache à poser sur la réponse complète.
+    version, changed_at = current(db, user_id, scope)
+    headers = _cache_headers(user_id, scope, version, changed_at)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers), headers
+        return None, headers
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and _settled(changed_at):
+        try:
+            since = parsedate_to_datetime(if_modified_since).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return None, headers
+        if changed_at.replace(microsecond=0) <= since:
+            return Response(status_code=304, headers=headers), headers
+    return None, headers
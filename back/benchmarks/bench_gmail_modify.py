@@ -0,0 +1,75 @@
+"""Round trips Gmail pour marquer N messages comme lus : modify unitaire vs batchModify.
+
+Usage (depuis back/) : python -m benchmarks.bench_gmail_modify [--messages 250] [--latency-ms 40]
+Le transport est simulé (latence fixe par appel) : seul le nombre d'allers-retours compte.
+"""
+import argparse
+import time
+
+from app.gmail_batch import GmailModifyBuffer
+
+
+class SimulatedGmail:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.round_trips = 0
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def _call(self):
+        self.round_trips += 1
+        time.sleep(self.latency)
+        return {}
+
+    def modify(self, userId, id, body):
+        return self
+
+    def batchModify(self, userId, body):
+        return self
+
+    def execute(self):
+        return self._call()
+
+
+def per_message(message_ids: list[str], latency: float) -> tuple[int, float]:
+    gmail = SimulatedGmail(latency)
+    started = time.perf_counter()
+    for message_id in message_ids:
+        gmail.users().messages().modify(userId="me", id=message_id, body={"removeLabelIds": ["UNREAD"]}).execute()
+    return gmail.round_trips, time.perf_counter() - started
+
+
+def buffered(message_ids: list[str], latency: float) -> tuple[int, float]:
+    gmail = SimulatedGmail(latency)
+    started = time.perf_counter()
+    buffer = GmailModifyBuffer(lambda: gmail)
+    for message_id in message_ids:
+        buffer.mark_read(message_id)
+    buffer.flush()
+    return gmail.round_trips, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=250)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    args = parser.parse_args()
+
+    message_ids = [f"msg-{index}" for index in range(args.messages)]
+    latency = args.latency_ms / 1000
+    naive_calls, naive_time = per_message(message_ids, latency)
+    batch_calls, batch_time = buffered(message_ids, latency)
+
+    print(f"messages: {args.messages}, latence simulée: {args.latency_ms:.0f} ms/appel")
+    print(f"{'mode':<22}{'appels':>8}{'durée (s)':>12}")
+    print(f"{'modify par message':<22}{naive_calls:>8}{naive_time:>12.3f}")
+    print(f"{'batchModify':<22}{batch_calls:>8}{batch_time:>12.3f}")
+    print(f"gain: x{naive_calls / max(batch_calls, 1):.0f} appels en moins")
+
+
+if __name__ == "__main__":
+    main()
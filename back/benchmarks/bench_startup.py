@@ -0,0 +1,81 @@
+"""Temps de démarrage du process API : rapport `-X importtime` de `import app.main`.
+
+Usage (depuis back/) : python -m benchmarks.bench_startup [--runs 5] [--top 15] [--budget-ms 0]
+Échoue (code 1) si un module lourd (clients Google/OAuth) est importé au démarrage,
+ou si la médiane dépasse --budget-ms quand il est fourni.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACK_DIR = Path(__file__).resolve().parents[1]
+
+# Doivent rester chargés à la demande (premier flow OAuth / première exécution d'applet).
+LAZY_MODULES = (
+    "googleapiclient.discovery",
+    "google.auth.transport.requests",
+    "google.oauth2.credentials",
+    "authlib.integrations.starlette_client",
+    "httpx",
+    "passlib.context",
+)
+
+
+def import_profile() -> tuple[float, dict[str, tuple[int, int]]]:
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACK_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed = time.perf_counter() - started
+    modules: dict[str, tuple[int, int]] = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return elapsed, modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    timings = []
+    modules: dict[str, tuple[int, int]] = {}
+    for _ in range(args.runs):
+        elapsed, modules = import_profile()
+        timings.append(elapsed * 1000)
+
+    median = statistics.median(timings)
+    print(f"process `import app.main` : médiane {median:.0f} ms, min {min(timings):.0f} ms ({args.runs} runs)")
+    print(f"import app.main (cumulé) : {modules.get('app.main', (0, 0))[1] / 1000:.0f} ms, {len(modules)} modules")
+    print(f"\n{'cumulé (ms)':>12}{'self (ms)':>11}  module")
+    top = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[: args.top]
+    for name, (self_us, cumulative_us) in top:
+        print(f"{cumulative_us / 1000:>12.1f}{self_us / 1000:>11.1f}  {name}")
+
+    eager = [name for name in LAZY_MODULES if name in modules]
+    failed = False
+    if eager:
+        print(f"\nÉCHEC : modules censés être chargés à la demande importés au démarrage : {', '.join(eager)}")
+        failed = True
+    else:
+        print("\nOK : aucun client Google/OAuth importé au démarrage")
+    if args.budget_ms and median > args.budget_ms:
+        print(f"ÉCHEC : médiane {median:.0f} ms > budget {args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""Octets d'un premier chargement de front/ : fichiers bruts vs bundle servi par SERVE_FRONT=1.
+
+Usage (depuis back/) : python -m benchmarks.bench_static_assets
+Les variantes brotli / WebP ne sont produites que si `brotli` / `Pillow` sont installés.
+"""
+import time
+
+from app.static_assets import StaticBundle
+
+
+def main():
+    started = time.perf_counter()
+    bundle = StaticBundle.build()
+    elapsed = time.perf_counter() - started
+    print(f"build : {elapsed * 1000:.0f} ms, {len(bundle.manifest)} fichiers hachés")
+    print(f"{'sources':<22}{bundle.source_bytes:>10} octets")
+    for label, encoding, webp in (
+        ("identity", None, False),
+        ("gzip", "gzip", False),
+        ("gzip + WebP", "gzip", True),
+        ("brotli + WebP", "br", True),
+    ):
+        served = bundle.served_bytes(encoding, webp)
+        print(f"{label:<22}{served:>10} octets ({served / bundle.source_bytes:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -305,9 +305,46 @@ const fetchLogs = async () => {
   });
   if (!response.ok) return;
   const logs = await response.json();
+  currentLogs = logs;
   renderLogs(logs);
 };
 
+let currentLogs = null;
+
+const startEventStream = async () => {
+  if (!isAuth || !window.EventSource) return;
+  const token = localStorage.getItem("access_token");
+  // Le JWT ne passe jamais dans l'URL : on l'échange contre un token de flux valable une minute.
+  const response = await fetch(`${API_URL}/applets/events/token`, {
+    method: "POST",
+    headers: { Authorization: `Bearer ${token}` },
+  });
+  if (!response.ok) return;
+  const { token: streamToken } = await response.json();
+  const source = new EventSource(`${API_URL}/applets/events?token=${encodeURIComponent(streamToken)}`);
+  source.addEventListener("error", () => {
+    // Reconnexion automatique refusée (token de flux expiré) : on redemande un token.
+    if (source.readyState === EventSource.CLOSED) {
+      setTimeout(startEventStream, 5000);
+    }
+  });
+  source.addEventListener("log", (event) => {
+    if (!currentLogs) return;
+    currentLogs = [JSON.parse(event.data), ...currentLogs].slice(0, 100);
+    renderLogs(currentLogs);
+  });
+  source.addEventListener("applet", () => {
+    if (myAppletsList) fetchApplets();
+  });
+  source.addEventListener("resync", () => {
+    if (currentLogs) fetchLogs();
+  });
+};
+
+if (historyLogsList || myAppletsList) {
+  startEventStream();
+}
+
 if (myAppletsList) {
   myAppletsList.addEventListener("click", async (event) => {
     const target = event.target;